@@ -1,9 +1,13 @@
 import pycpsw
+import threading
+import time
+import sys
+import getopt
 import numpy as np
 from   loadYaml import LoadYaml
 
 def myOpts():
-  return ""
+  return "m:s:"
 
 def init():
   l = LoadYaml( myOpts() )
@@ -11,7 +15,11 @@ def init():
 
 class BpmStream:
   def __init__(self, streamPath):
-    self.strm_ = pycpsw.Stream.create( streamPath )
+    if hasattr( streamPath, "read" ):
+      # already a stream (e.g., a bpmCapture.ReplayStream)
+      self.strm_ = streamPath
+    else:
+      self.strm_ = pycpsw.Stream.create( streamPath )
 
   @staticmethod
   def bufAlloc(n = 1):
@@ -21,14 +29,20 @@ class BpmStream:
     buf.fill(0)
     return buf
 
-  def read(self, buf = None, n=0):
+  # Read 'n' packets into the rows of 'buf'; if 'lens' is given
+  # then the byte-length of each packet is stored there.
+  def read(self, buf = None, n=0, lens = None):
     if isinstance( buf, type(None) ):
-      buf = bufAlloc(n)
+      buf = self.bufAlloc(n)
     if n <= 0 or n > len(buf):
       n = len(buf)
     with self.strm_ as f:
-      for v in buf[0:n]:
-        l = f.read(v)
+      if isinstance( lens, type(None) ):
+        for v in buf[0:n]:
+          l = f.read(v)
+      else:
+        for i in range(0, n):
+          l = lens[i] = f.read(buf[i])
     return int( l/2 ) # number of int16
 
   @staticmethod
@@ -49,13 +63,122 @@ class BpmStream:
     hoff = (((msg[0]>>4) & 0xf) + 1)*4 # Offset where waveform starts
     return pid, stat, tmit, x, y, hoff
 
+  # Header layout as seen by 'parseMsg' (offsets in bytes; words are
+  # little-endian with the low 16-bit word first)
+  hdrDtype = np.dtype( { 'names'   : [ 'w0', 'stat', 'tmit', 'x', 'y', 'pid' ],
+                         'formats' : [ '<i2', '<u2', '<i4', '<i4', '<i4', '<i8' ],
+                         'offsets' : [ 0, 2, 4, 8, 12, 24 ],
+                         'itemsize': 32 } )
 
+  # Batch version of 'parseMsg': decode all rows of a (n,1500) buffer
+  # (as obtained from 'bufAlloc'/'read') in one go. 'lens' optionally
+  # holds the byte-length of each packet (as returned by the stream's
+  # 'read'); if omitted the full row is assumed to be valid.
+  #
+  # Returns columns (pid, stat, tmit, x, y, hoff, nelms).
+  @staticmethod
+  def parseMsgs(buf, lens = None):
+    buf = np.asarray(buf, 'int16')
+    if 1 == buf.ndim:
+      buf = buf.reshape( (1, len(buf)) )
+    hdr = buf[:, 0:16]
+    try:
+      # zero-copy if the rows are contiguous (strides between rows don't matter)
+      hdr = hdr.view( BpmStream.hdrDtype )[:,0]
+    except ValueError:
+      hdr = np.ascontiguousarray( hdr ).view( BpmStream.hdrDtype )[:,0]
+    pid  = hdr['pid' ].astype('int64')
+    stat = hdr['stat'].astype('uint16')
+    tmit = hdr['tmit'].astype('int32')
+    x    = hdr['x'   ].astype('int32')
+    y    = hdr['y'   ].astype('int32')
+    hoff = (((hdr['w0'].astype('int32') >> 4) & 0xf) + 1)*4
+    if isinstance( lens, type(None) ):
+      nelms = np.full( len(buf), buf.shape[1], 'int32' )
+    else:
+      nelms = np.asarray( lens, 'int32' )[0:len(buf)] // 2
+    return pid, stat, tmit, x, y, hoff, nelms
+
+
+  # Read 'n' consecutive packets and extract their waveforms (starting
+  # at each packet's 'hoff'; samples missing from short packets are
+  # zero) into 'wf', a (n,128,4) int16 block. If 'wf' is None then a
+  # block is taken from the stream's pool; hand it back with
+  # 'releaseWaveforms' once done so that later calls reuse it.
+  #
+  # Packets are read in chunks of 'wfChunk' into a staging buffer
+  # which is kept across calls.
+  #
+  # Returns (wf, cols) where 'cols' are the header columns (pid, stat,
+  # tmit, x, y, hoff, nelms) as returned by 'parseMsgs'. Fewer than 'n'
+  # rows are returned if the stream ends (replayed capture).
+  wfShape = (128, 4)
+  wfChunk = 256
+
+  def readWaveforms(self, n, wf = None):
+    if None is wf:
+      wf = self.wfPool().get( n )
+    elif len(wf) < n:
+      raise RuntimeError("Waveform block too small for {} packets".format(n))
+    try:
+      stg = self.wfStg_
+      sln = self.wfStgLens_
+    except AttributeError:
+      stg = self.wfStg_     = self.bufAlloc( self.wfChunk )
+      sln = self.wfStgLens_ = np.zeros( self.wfChunk, 'int32' )
+    wlen = self.wfShape[0] * self.wfShape[1]
+    flat = wf.reshape( ( len(wf), wlen ) )
+    cols = []
+    got  = 0
+    with self.strm_ as f:
+      while got < n:
+        m = min( n - got, len(stg) )
+        k = 0
+        while k < m:
+          l = sln[k] = f.read( stg[k] )
+          if 0 >= l:
+            break # end of a replayed capture
+          k += 1
+        if 0 == k:
+          break
+        c    = self.parseMsgs( stg[0:k], sln[0:k] )
+        hoff = c[5]
+        avl  = np.clip( c[6] - hoff, 0, wlen )
+        dst  = flat[got:got+k]
+        h    = hoff[0]
+        if np.all( hoff == h ) and np.all( avl == wlen ):
+          dst[:] = stg[0:k, h:h+wlen]
+        else:
+          for i in range(k):
+            dst[i, 0:avl[i]] = stg[i, hoff[i]:hoff[i]+avl[i]]
+            dst[i, avl[i]:]  = 0
+        cols.append( c )
+        got += k
+        if k < m:
+          break
+    if 0 == len(cols):
+      cols = [ self.parseMsgs( stg[0:0], sln[0:0] ) ]
+    if got < len(wf):
+      wf = wf[0:got]
+    return ( wf, tuple( [ np.concatenate( c ) for c in zip( *cols ) ] ) )
+
+  def wfPool(self):
+    try:
+      return self.wfPool_
+    except AttributeError:
+      self.wfPool_ = WaveformPool( self.wfShape )
+      return self.wfPool_
+
+  def releaseWaveforms(self, wf):
+    self.wfPool().put( wf )
+
+  # Single waveform (128,4); the result is overwritten by the next call.
   def readWaveform(self):
-    buf   = self.bufAlloc()
-    nelms = self.read(buf)
-    pid, stat, tmit, x, y, hoff = self.parseMsg( buf[0] )
-    print("reshaping nelms {}, hoff{}".format(nelms,hoff))
-    return np.reshape( buf[0][hoff:nelms], (128, 4) )
+    try:
+      wf = self.wfBuf_
+    except AttributeError:
+      wf = self.wfBuf_ = self.wfPool().get( 1 )
+    return self.readWaveforms( 1, wf )[0][0]
 
   def scn(self):
     buf = self.bufAlloc()
@@ -63,11 +186,524 @@ class BpmStream:
     with self.strm_ as f:
       while True:
         l     = f.read(buf[0])
+        if 0 >= l:
+          break # end of a replayed capture
         nelms = int(l/2)
         pid, stat, tmit, x, y, hoff = self.parseMsg( buf[0] )
         print("{:20d} {:04x} {:6d} {:6d} {:6d}".format(pid, stat, tmit, x, y))
 
+  # Monitor mode: packets are acquired by a BpmStreamRing, decoded
+  # in batches and summarized (PulseStats) every 'interval' seconds.
+  # Pulse-ID continuity (PidCheck) is accumulated over the entire run.
+  # The display cost is independent of the pulse rate.
+  def mon(self, interval = 1.0, nslots = 4096, pidStride = 1):
+    stats = PulseStats()
+    pids  = PidCheck( pidStride )
+    with BpmStreamRing( self, nslots ) as rng:
+      nxt = time.monotonic() + interval
+      while True:
+        now = time.monotonic()
+        if now >= nxt:
+          stats.dump( rng.getOverruns() )
+          pids.dump()
+          stats.reset()
+          nxt = nxt + interval
+          if nxt < now:
+            nxt = now + interval
+          continue
+        (bufs, lens) = rng.get( timeout = nxt - now )
+        if len(bufs) > 0:
+          cols = self.parseMsgs( bufs, lens )
+          stats.update( *cols )
+          pids.update( cols[0] )
+          rng.release( len(bufs) )
+
+# Pool of (n,128,4) int16 waveform blocks (at most 'maxFree' unused
+# blocks of each size are kept).
+class WaveformPool:
+  def __init__(self, shape = (128, 4), maxFree = 4):
+    self.shape_ = tuple( shape )
+    self.max_   = maxFree
+    self.free_  = dict()
+    self.lock_  = threading.Lock()
+
+  def get(self, n):
+    with self.lock_:
+      l = self.free_.get( n )
+      if l:
+        return l.pop()
+    return np.zeros( (n,) + self.shape_, 'int16' )
+
+  # 'wf' may also be a leading slice of a block (as returned by
+  # BpmStream.readWaveforms after a short read); the block is recycled.
+  def put(self, wf):
+    b = wf.base
+    if ( isinstance( b, np.ndarray ) and b.base is None and b.shape[1:] == wf.shape[1:]
+         and b.__array_interface__['data'][0] == wf.__array_interface__['data'][0] ):
+      wf = b
+    # only whole blocks are recycled
+    if wf.base is not None or wf.shape[1:] != self.shape_:
+      return
+    with self.lock_:
+      l = self.free_.setdefault( len(wf), [] )
+      if len(l) < self.max_:
+        l.append( wf )
+
+# Running statistics of decoded packets (see BpmStream.parseMsgs)
+# over a reporting interval.
+class PulseStats:
+  cols    = [ "X", "Y", "TMIT" ]
+  maxStat = 8
+
+  def __init__(self):
+    self.reset()
+
+  def reset(self):
+    self.t0_   = time.monotonic()
+    self.n_    = 0
+    self.sum_  = np.zeros( len(self.cols) )
+    self.sum2_ = np.zeros( len(self.cols) )
+    self.min_  = np.full ( len(self.cols), np.inf  )
+    self.max_  = np.full ( len(self.cols), -np.inf )
+    self.stat_ = dict()
+
+  def update(self, pid, stat, tmit, x, y, hoff = None, nelms = None):
+    if 0 == len(pid):
+      return
+    v           = np.array( [ x, y, tmit ], 'float64' )
+    self.n_    += len(pid)
+    self.sum_  += np.sum( v,   1 )
+    self.sum2_ += np.sum( v*v, 1 )
+    self.min_   = np.minimum( self.min_, np.min( v, 1 ) )
+    self.max_   = np.maximum( self.max_, np.max( v, 1 ) )
+    (vals, cnts) = np.unique( stat, return_counts = True )
+    for (k, c) in zip( vals.tolist(), cnts.tolist() ):
+      self.stat_[k] = self.stat_.get(k, 0) + c
+
+  def getRate(self):
+    dt = time.monotonic() - self.t0_
+    if dt <= 0.0:
+      return 0.0
+    return self.n_/dt
+
+  def getMean(self):
+    return self.sum_/max( self.n_, 1 )
+
+  def getRms(self):
+    m = self.getMean()
+    return np.sqrt( np.maximum( self.sum2_/max( self.n_, 1 ) - m*m, 0.0 ) )
+
+  def getStatHist(self):
+    return dict( self.stat_ )
+
+  def dump(self, overruns = None):
+    ln = "Rate: {:10.1f}/s, pulses: {:d}".format( self.getRate(), self.n_ )
+    if overruns != None:
+      ln += ", overruns: {:d}".format( overruns )
+    print( ln )
+    if 0 == self.n_:
+      return
+    print("{:>6s} {:>12s} {:>12s} {:>12s} {:>12s}".format("", "MEAN", "RMS", "MIN", "MAX"))
+    for (nm, m, r, lo, hi) in zip( self.cols, self.getMean(), self.getRms(), self.min_, self.max_ ):
+      print("{:>6s} {:12.2f} {:12.2f} {:12d} {:12d}".format(nm, m, r, int(lo), int(hi)))
+    # show the most frequent status words only
+    top = sorted( self.stat_.items(), key = lambda kv: -kv[1] )
+    ln  = "  STAT: " + " ".join( [ "{:04x}:{:d}".format(k, c) for (k, c) in sorted( top[0:self.maxStat] ) ] )
+    if len(top) > self.maxStat:
+      ln += " (+{:d} others: {:d})".format( len(top) - self.maxStat, sum( [ c for (k, c) in top[self.maxStat:] ] ) )
+    print( ln )
+
+# Pulse-ID continuity checker. Feed it (decoded) pulse-ID arrays
+# in arrival order; counters are cumulative (until 'reset') and
+# may be queried at any time.
+#
+# Every pulse ID is classified as
+#  - seen before               -> duplicate
+#  - lower than the highest ID
+#    seen before it            -> reordered (late) packet
+#  - higher by more than stride-> gap; the skipped IDs are counted
+#                                 as 'missing' (late arrivals are
+#                                 not subtracted from this count
+#                                 but 'getLost' accounts for them)
+#
+# The IDs seen are remembered for the last 'window' pulses (below
+# the highest ID); an older ID is counted as reordered even if it
+# is a duplicate.
+#
+# 'stride' is the pulse-ID increment between consecutive packets
+# (e.g., for a rate-limited stream).
+class PidCheck:
+  def __init__(self, stride = 1, window = 4096):
+    if stride <= 0:
+      raise RuntimeError("PidCheck: stride must be positive")
+    self.stride_ = stride
+    self.win_    = window
+    self.reset()
+
+  def reset(self):
+    self.t0_    = time.monotonic()
+    self.first_ = None
+    self.hi_    = None
+    self.nrcv_  = 0
+    self.ndup_  = 0
+    self.nord_  = 0
+    self.ngap_  = 0
+    self.nmis_  = 0
+    self.seen_  = np.zeros( 0, 'int64' )
+
+  def update(self, pid):
+    pid = np.asarray( pid, 'int64' )
+    if 0 == len(pid):
+      return
+    if None == self.first_:
+      self.first_ = int( pid[0] )
+      self.hi_    = int( pid[0] ) - self.stride_
+    # highest pid seen *before* each element
+    prv    = np.maximum.accumulate( np.concatenate( ( [ self.hi_ ], pid[:-1] ) ) )
+    prv    = np.maximum( prv, self.hi_ )
+    d      = pid - prv
+    # duplicates: seen in an earlier batch or earlier in this one
+    (u, first) = np.unique( pid, return_index = True )
+    dup        = np.isin( pid, self.seen_ )
+    rpt        = np.ones( len(pid), bool )
+    rpt[first] = False
+    dup       |= rpt
+    gaps   = d[ d > self.stride_ ]
+    self.nrcv_ += len(pid)
+    self.ndup_ += int( np.count_nonzero( dup ) )
+    self.nord_ += int( np.count_nonzero( ( d < 0 ) & ~dup ) )
+    self.ngap_ += len(gaps)
+    self.nmis_ += int( np.sum( gaps // self.stride_ - 1 ) )
+    self.hi_    = max( self.hi_, int( prv[-1] ), int( pid[-1] ) )
+    seen        = np.union1d( self.seen_, u )
+    self.seen_  = seen[ seen > self.hi_ - self.win_*self.stride_ ]
+
+  def getReceived(self):
+    return self.nrcv_
+
+  def getDuplicates(self):
+    return self.ndup_
+
+  def getReordered(self):
+    return self.nord_
+
+  def getGaps(self):
+    return self.ngap_
+
+  def getMissing(self):
+    return self.nmis_
+
+  # number of pulse IDs expected from the first to the highest one seen
+  def getExpected(self):
+    if None == self.first_:
+      return 0
+    return ( self.hi_ - self.first_ ) // self.stride_ + 1
+
+  # net loss (expected - unique received)
+  def getLost(self):
+    return max( self.getExpected() - ( self.nrcv_ - self.ndup_ ), 0 )
+
+  # (received, expected) per second since reset
+  def getRates(self):
+    dt = time.monotonic() - self.t0_
+    if dt <= 0.0:
+      return (0.0, 0.0)
+    return ( self.nrcv_/dt, self.getExpected()/dt )
+
+  def dump(self):
+    (rcv, exp) = self.getRates()
+    print("PID: received {:d}/{:d} expected ({:.1f}/s vs. {:.1f}/s), lost {:d}, gaps {:d} (missing {:d}), dups {:d}, reordered {:d}".format(
+          self.nrcv_, self.getExpected(), rcv, exp, self.getLost(), self.ngap_, self.nmis_, self.ndup_, self.nord_))
+
+# Continuous acquisition: a thread reads packets from the stream
+# into a preallocated ring of slots (and records their byte-lengths).
+#
+#   with BpmStreamRing( BpmStream( path ) ) as rng:
+#     while True:
+#       (bufs, lens) = rng.get()      # zero-copy views of filled slots
+#       ... parseMsgs( bufs, lens ) ...
+#       rng.release( len(bufs) )
+#
+# If the consumer falls behind and the ring is full then new packets
+# are read into a scratch slot and dropped; 'getOverruns()' counts
+# them. The stream itself is never stalled by the consumer.
+#
+# Several rings may share one condition variable ('cond') so that a
+# consumer can wait for any of them (see BpmStreamMerge).
+class BpmStreamRing:
+  def __init__(self, strm, nslots = 4096, timeoutUs = 100000, cond = None):
+    if 0 >= nslots:
+      raise RuntimeError("BpmStreamRing: need at least one slot")
+    self.strm_    = strm.strm_
+    self.nslots_  = nslots
+    self.bufs_    = BpmStream.bufAlloc( nslots )
+    self.lens_    = np.zeros( nslots, 'int32' )
+    self.spare_   = BpmStream.bufAlloc( 1 )[0]
+    self.tmo_     = timeoutUs
+    self.head_    = 0  # total number of slots filled
+    self.tail_    = 0  # total number of slots released
+    self.ovr_     = 0
+    self.cond_    = cond if None != cond else threading.Condition()
+    self.thread_  = None
+    self.run_     = False
+
+  def start(self):
+    if self.thread_ != None:
+      return
+    self.run_    = True
+    self.thread_ = threading.Thread( target = self.acq_, daemon = True )
+    self.thread_.start()
+
+  def stop(self):
+    if self.thread_ == None:
+      return
+    self.run_ = False
+    self.thread_.join()
+    self.thread_ = None
+    with self.cond_:
+      self.cond_.notify_all()
+
+  def __enter__(self):
+    self.start()
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.stop()
+    return False
+
+  def acq_(self):
+    with self.strm_ as f:
+      while self.run_:
+        full = ( self.head_ - self.tail_ >= self.nslots_ )
+        if full:
+          slot = self.spare_
+        else:
+          idx  = self.head_ % self.nslots_
+          slot = self.bufs_[idx]
+        l = f.read( slot, self.tmo_ )
+        if 0 >= l:
+          continue # timeout
+        if full:
+          self.ovr_ += 1
+          continue
+        self.lens_[idx] = l
+        with self.cond_:
+          self.head_ += 1
+          self.cond_.notify()
+
+  # Wait (up to 'timeout' seconds; forever if None) for filled slots
+  # and return views (bufs, lens) of up to 'maxn' of them. The slots
+  # are owned by the caller until they are handed back by 'release'.
+  # Empty views are returned on timeout.
+  def get(self, maxn = 0, timeout = None):
+    with self.cond_:
+      if self.head_ == self.tail_:
+        self.cond_.wait_for( lambda: self.head_ != self.tail_ or not self.run_, timeout )
+      n = self.head_ - self.tail_
+    idx = self.tail_ % self.nslots_
+    # a view cannot wrap around the end of the ring
+    if idx + n > self.nslots_:
+      n = self.nslots_ - idx
+    if maxn > 0 and n > maxn:
+      n = maxn
+    return ( self.bufs_[idx:idx+n], self.lens_[idx:idx+n] )
+
+  def release(self, n):
+    with self.cond_:
+      if n > self.head_ - self.tail_:
+        raise RuntimeError("BpmStreamRing: releasing more slots than filled")
+      self.tail_ += n
+
+  def getOverruns(self):
+    return self.ovr_
+
+  def getReceived(self):
+    return self.head_ + self.ovr_
+
+  def getPending(self):
+    return self.head_ - self.tail_
+
+# Join several streams (e.g., the BPMs of both bays) on pulse ID.
+#
+# Every stream is acquired by its own BpmStreamRing; decoded records
+# (parseMsgs) are held per stream until a record with the same pulse
+# ID has arrived from all streams. Such pulses are emitted as aligned
+# columns:
+#
+#   with BpmStreamMerge( [ BpmStream( p ) for p in paths ] ) as mrg:
+#     while True:
+#       (pid, stat, tmit, x, y) = mrg.get()  # pid: (k,), others: (k, nstreams)
+#
+# Records may arrive out of order (and streams may lag each other) by up
+# to 'window' pulse IDs: a record is given up (counted as unmatched for
+# its stream, see 'getUnmatched') once every stream has delivered a pulse
+# ID more than 'window' beyond it. At most 'maxPending' records are held
+# per stream (the oldest are given up first), i.e., memory is bounded
+# no matter how fast (or unbalanced) the inputs are; packets the rings
+# cannot absorb are counted as overruns.
+class BpmStreamMerge:
+  def __init__(self, strms, window = 1024, maxPending = 4096, nslots = 4096, batch = 1024):
+    self.cond_   = threading.Condition()
+    self.rngs_   = [ BpmStreamRing( s, nslots, cond = self.cond_ ) for s in strms ]
+    self.win_    = window
+    self.maxp_   = maxPending
+    self.batch_  = batch
+    self.reset()
+
+  def reset(self):
+    n            = len(self.rngs_)
+    self.pend_   = [ self.empty_() for i in range(n) ]
+    self.newest_ = [ None for i in range(n) ]
+    self.nunm_   = np.zeros( n, 'int64' )
+    self.ndup_   = np.zeros( n, 'int64' )
+    self.nmat_   = 0
+
+  # columns (pid, stat, tmit, x, y) without records
+  @staticmethod
+  def empty_():
+    return ( np.zeros( 0, 'int64' ), np.zeros( 0, 'uint16' ),
+             np.zeros( 0, 'int32' ), np.zeros( 0, 'int32' ), np.zeros( 0, 'int32' ) )
+
+  def start(self):
+    for r in self.rngs_:
+      r.start()
+
+  def stop(self):
+    for r in self.rngs_:
+      r.stop()
+
+  def __enter__(self):
+    self.start()
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.stop()
+    return False
+
+  @staticmethod
+  def select_(cols, idx):
+    return tuple( [ c[idx] for c in cols ] )
+
+  # move decoded records from the rings to the per-stream pending
+  # lists (sorted by pulse ID; duplicates are dropped)
+  def poll_(self):
+    for (i, r) in enumerate( self.rngs_ ):
+      (bufs, lens) = r.get( self.batch_, 0 )
+      if 0 == len(bufs):
+        continue
+      cols = BpmStream.parseMsgs( bufs, lens )[0:5]
+      r.release( len(bufs) )
+      cols = tuple( [ np.concatenate( ( p, c ) ) for (p, c) in zip( self.pend_[i], cols ) ] )
+      (u, first) = np.unique( cols[0], return_index = True )
+      self.ndup_[i]  += len(cols[0]) - len(u)
+      self.pend_[i]   = self.select_( cols, first )
+      nw              = int( u[-1] )
+      if None == self.newest_[i] or nw > self.newest_[i]:
+        self.newest_[i] = nw
+
+  # remove and return the records present in all streams
+  def match_(self):
+    pids = self.pend_[0][0]
+    for p in self.pend_[1:]:
+      pids = np.intersect1d( pids, p[0], assume_unique = True )
+    cols = [ [] for c in range(4) ]
+    for (i, p) in enumerate( self.pend_ ):
+      idx  = np.searchsorted( p[0], pids )
+      for c in range(4):
+        cols[c].append( p[c + 1][idx] )
+      keep       = np.ones( len(p[0]), bool )
+      keep[idx]  = False
+      self.pend_[i] = self.select_( p, keep )
+    self.nmat_ += len(pids)
+    if 0 == len(pids):
+      e = self.empty_()
+      return ( pids, ) + tuple( [ np.zeros( ( 0, len(self.pend_) ), c.dtype ) for c in e[1:] ] )
+    return ( pids, ) + tuple( [ np.stack( c, 1 ) for c in cols ] )
+
+  # give up records which can no longer be matched (or exceed 'maxPending')
+  def evict_(self):
+    hor = None
+    if not None in self.newest_:
+      hor = min( self.newest_ ) - self.win_
+    for (i, p) in enumerate( self.pend_ ):
+      k = 0
+      if None != hor:
+        k = int( np.searchsorted( p[0], hor ) )
+      k = max( k, len(p[0]) - self.maxp_ )
+      if k > 0:
+        self.nunm_[i] += k
+        self.pend_[i]  = self.select_( p, slice( k, None ) )
+
+  # Wait (up to 'timeout' seconds; forever if None) for data and return
+  # the pulses which could be matched (pid, stat, tmit, x, y); pid has
+  # shape (k,), the other columns (k, nstreams). 'k' may be 0.
+  def get(self, timeout = None):
+    with self.cond_:
+      self.cond_.wait_for( lambda: any( [ r.getPending() > 0 or not r.run_ for r in self.rngs_ ] ), timeout )
+    self.poll_()
+    res = self.match_()
+    self.evict_()
+    return res
+
+  # Count everything still pending as unmatched (e.g., at the end of a run).
+  def flush(self):
+    for (i, p) in enumerate( self.pend_ ):
+      self.nunm_[i] += len(p[0])
+      self.pend_[i]  = self.empty_()
+
+  def getMatched(self):
+    return self.nmat_
+
+  # per-stream counts
+  def getUnmatched(self):
+    return self.nunm_.copy()
+
+  def getDuplicates(self):
+    return self.ndup_.copy()
+
+  def getOverruns(self):
+    return np.array( [ r.getOverruns() for r in self.rngs_ ] )
+
+  def getPending(self):
+    return np.array( [ len(p[0]) for p in self.pend_ ] )
+
+  def dump(self):
+    print("Matched: {:d}, unmatched: {}, duplicates: {}, overruns: {}".format(
+          self.nmat_, self.getUnmatched().tolist(), self.getDuplicates().tolist(), self.getOverruns().tolist()))
+
+  # Print the aligned pulses (pid and x/y/tmit of every stream) as they
+  # are matched; if 'interval' is given then only print the counters
+  # every 'interval' seconds.
+  def scn(self, interval = None):
+    with self:
+      nxt = None if None == interval else time.monotonic() + interval
+      while True:
+        (pid, stat, tmit, x, y) = self.get( timeout = interval )
+        if None == interval:
+          for i in range( len(pid) ):
+            print("{:16x}".format( pid[i] ), end='')
+            for k in range( len(self.rngs_) ):
+              print("  {:8d} {:8d} {:8d}".format( x[i,k], y[i,k], tmit[i,k] ), end='')
+            print()
+        elif time.monotonic() >= nxt:
+          self.dump()
+          nxt = time.monotonic() + interval
+
 if __name__ == "__main__":
+  opts, args = getopt.getopt( sys.argv[1:], myOpts() + LoadYaml.usedOpts() )
+  monIntvl = None
+  mrgStrms = None
+  for opt,arg in opts:
+    if opt == "-m":
+      monIntvl = float(arg)
+    elif opt == "-s":
+      mrgStrms = arg.split(",")
   r = init()
+  if None != mrgStrms:
+    BpmStreamMerge( [ BpmStream( r.findByName( n ) ) for n in mrgStrms ] ).scn( monIntvl )
+    sys.exit(0)
   s = BpmStream( r.findByName("BPM_A_Stream") )
-  s.scn()
+  if None != monIntvl:
+    s.mon( monIntvl )
+  else:
+    s.scn()
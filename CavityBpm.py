@@ -64,27 +64,180 @@ class CavityBpm:
     return self.cplx( self._vCplx.getVal() )
 
 
-  def scanDFT(self, ch=0):
-    nsmpls = sv("NumSamples", self._path).getVal() + 1;
-    resr   = sv("DFTDiagChannels[{:d}]/DFT_R".format(ch), self._path)
-    resu   = sv("DFTDiagChannels[{:d}]/DFT_U".format(ch), self._path)
-    resv   = sv("DFTDiagChannels[{:d}]/DFT_V".format(ch), self._path)
-    R = list()
-    U = list()
-    V = list()
-    raw = list()
-    self.setWeightReal(ch)
+  # vectorized 'flt2i17'
+  @staticmethod
+  def flt2i17v(v):
+    return np.minimum( np.round( np.asarray( v ) * 2.0**17 ), 2**17 - 1 ).astype('int64')
+
+  # vectorized 'cplx'
+  @staticmethod
+  def cplxv(x):
+    x  = np.asarray( x, 'int64' )
+    re = ((x >> 16) & 0xffff) - 0x10000*( ((x >> 16) & 0xffff) >= 0x8000 )
+    im = ( x        & 0xffff) - 0x10000*( ( x        & 0xffff) >= 0x8000 )
+    return re + 1j*im
+
+  # DFT coefficients (Coeff2C1, Coeff2S1, Coeff2C2, Coeff2C4) for
+  # all 'nsmpls' bins; returns a (4, nsmpls) array
+  def dftCoeffs(self, nsmpls):
+    fi = 2*np.pi*np.arange( nsmpls )/nsmpls
+    return self.flt2i17v( [ np.cos(1*fi), np.sin(1*fi), np.cos(2*fi), np.cos(4*fi) ] )
+
+  # Create the coefficient (write) and result (read) handles for DFT
+  # channels 'chans' and set unit weights and scales.
+  dftCoeffNames = [ "Coeff2C1", "Coeff2S1", "Coeff2C2", "Coeff2C4" ]
+
+  def dftSetup_(self, chans):
+    wr     = list()
+    rd     = list()
+    for c in chans:
+      dft = self._path.findByName("DFTChannels[{:d}]".format(c))
+      wr.append( [ sv(nm, dft) for nm in self.dftCoeffNames ] )
+      rd.append( [ sv("DFTDiagChannels[{:d}]/DFT_{}".format(c, nm), self._path) for nm in [ "R", "U", "V" ] ] )
+      self.setWeightReal(c)
     sv("DFTScaleR", self._path).setVal(32768)
     sv("DFTScaleU", self._path).setVal(32768)
     sv("DFTScaleV", self._path).setVal(32768)
-    for i in range(0,nsmpls):
-      self.setDFT(2*np.pi*i/nsmpls, ch)
-      raw.append( self.cplx( resr.getVal() ) )
-      R.append( self.cabs( resr.getVal() ) )
-      U.append( self.cabs( resu.getVal() ) )
-      V.append( self.cabs( resv.getVal() ) )
+    return (wr, rd)
+
+  # Program the coefficients of each of 'bins' (columns of 'coefs', a
+  # list of lists as from 'dftCoeffs') and read the results; unchanged
+  # coefficients are not rewritten. Returns raw results [chan, R/U/V, bin].
+  def dftRead_(self, wr, rd, coefs, bins):
+    nch  = len(wr)
+    nco  = len(self.dftCoeffNames)
+    res  = np.zeros( ( nch, 3, len(bins) ), 'int64' )
+    last = [ [ None for j in range(nco) ] for k in range(nch) ]
+    for (b, i) in enumerate( bins ):
+      for k in range(0, nch):
+        for j in range(0, nco):
+          if last[k][j] != coefs[j][i]:
+            wr[k][j].setVal( coefs[j][i] )
+            last[k][j] = coefs[j][i]
+      for k in range(0, nch):
+        for j in range(0, 3):
+          res[k, j, b] = rd[k][j].getVal()
+    return res
+
+  # Scan all DFT bins. 'ch' may be a single DFT channel or a list
+  # of channels which are swept together. All register handles are
+  # created once, coefficients are computed up-front, unchanged
+  # coefficients are not rewritten and each result register is
+  # read once per bin.
+  #
+  # Returns numpy arrays (U,V,R,raw); these are 1-D if 'ch' is a
+  # single channel, otherwise they are indexed [channel, bin].
+  def scanDFT(self, ch=0):
+    chans  = np.atleast_1d( ch ).tolist()
+    nsmpls = sv("NumSamples", self._path).getVal() + 1;
+    coefs  = self.dftCoeffs( nsmpls ).tolist()
+    (wr, rd) = self.dftSetup_( chans )
+    res  = self.dftRead_( wr, rd, coefs, range(0, nsmpls) )
+    raw = self.cplxv( res[:, 0, :] )
+    R   = np.abs( raw )
+    U   = np.abs( self.cplxv( res[:, 1, :] ) )
+    V   = np.abs( self.cplxv( res[:, 2, :] ) )
+    if np.ndim( ch ) == 0:
+      return (U[0],V[0],R[0],raw[0])
     return (U,V,R,raw)
 
+  # Channels of the raw stream waveforms ((128,4) per packet, see
+  # BpmStream.readWaveforms) are mapped to spare, V, U, Ref.
+  wfChanV = 1
+  wfChanU = 2
+  wfChanR = 3
+
+  # DFT kernel represented by the quantized coefficients ('dftCoeffs'):
+  # the frequency of bin 'k' follows from the quantized cosine alone,
+  # acos(Coeff2C1/2**17), in the half plane given by the sign of
+  # Coeff2S1. Near DC and Nyquist one LSB of the cosine moves this
+  # frequency by up to ~sqrt(2*2**-17) = 4e-3 rad (at DC the cosine
+  # saturates at 1 - 2**-17) -- this is not negligible.
+  # Returns a (nsmpls bins, nsmpls samples) complex array.
+  def dftKernel(self, nsmpls):
+    c  = self.dftCoeffs( nsmpls )/2.0**17
+    fi = np.arccos( np.clip( c[0], -1.0, 1.0 ) )
+    fi = np.where( c[1] < 0, -fi, fi )
+    return np.exp( -1j*np.outer( fi, np.arange( nsmpls ) ) )
+
+  # Software spectrum of raw waveforms 'wf' ((n,128,4) or (128,4)):
+  # the first 'nsmpls' samples of every channel are averaged over the
+  # waveforms and transformed with the quantized kernel ('dftKernel'),
+  # i.e., at the frequencies the firmware DFT is programmed to by
+  # 'scanDFT' (rather than the ideal bins 2*pi*k/nsmpls of an FFT).
+  # This is a dense matrix product -- O(nsmpls**2) per channel (the
+  # kernel is rebuilt on every call), which is negligible for the
+  # <= 128 samples of a waveform; an FFT does not apply since the
+  # quantized frequencies are not equally spaced.
+  # U and V are scaled by the quantized weight (cf. 'setWeightReal').
+  #
+  # Returns (U,V,R,raw) (nsmpls bins each), like 'scanDFT' (up to the
+  # scale of the firmware result).
+  def spectrum(self, wf, nsmpls, weight = 1.0):
+    wf = np.asarray( wf )
+    if 2 == wf.ndim:
+      wf = wf[np.newaxis]
+    if 0 == wf.shape[0]:
+      raise RuntimeError("No waveforms")
+    if nsmpls > wf.shape[1]:
+      raise RuntimeError("Waveforms have only {} samples ({} needed)".format(wf.shape[1], nsmpls))
+    X   = self.dftKernel( nsmpls ) @ np.mean( wf[:, 0:nsmpls, :], 0, dtype = 'float64' )
+    w   = self.flt2i17v( weight )/2.0**17
+    raw = X[:, self.wfChanR]
+    return ( np.abs( X[:, self.wfChanU] )*w, np.abs( X[:, self.wfChanV] )*w, np.abs( raw ), raw )
+
+  # Cross-check a software spectrum (U,V,R[,raw]) against the firmware
+  # DFT (channel 'ch') at a few 'bins'. For each of U, V, R the scale
+  # between firmware and software is fitted (least squares) and the
+  # relative rms residual is reported.
+  #
+  # Returns a dict { "bins": .., "U": (scale, residual, fw), "V": .., "R": .. }
+  def crossCheck(self, spec, bins, ch=0):
+    bins   = np.atleast_1d( bins ).tolist()
+    nsmpls = len( spec[0] )
+    coefs  = self.dftCoeffs( nsmpls ).tolist()
+    (wr, rd) = self.dftSetup_( [ ch ] )
+    res    = self.dftRead_( wr, rd, coefs, bins )[0]
+    fw     = { "R": np.abs( self.cplxv( res[0] ) ),
+               "U": np.abs( self.cplxv( res[1] ) ),
+               "V": np.abs( self.cplxv( res[2] ) ) }
+    chk    = { "bins": bins }
+    for (nm, sw) in zip( [ "U", "V", "R" ], spec[0:3] ):
+      sw  = np.asarray( sw )[bins]
+      f   = fw[nm]
+      den = np.dot( sw, sw )
+      scl = np.dot( f, sw )/den if den > 0 else 0.0
+      nrm = np.sqrt( np.mean( f*f ) )
+      rsd = np.sqrt( np.mean( ( f - scl*sw )**2 ) )/nrm if nrm > 0 else 0.0
+      chk[nm] = ( scl, rsd, f )
+    return chk
+
+  # Fast spectral scan: one capture of 'nwf' waveforms from 'strm' (a
+  # BpmStream) replaces sweeping all bins through the firmware DFT; the
+  # spectrum is computed in software with the quantized DFT kernel (see
+  # 'spectrum'). Unless 'nspot' is 0 the result is spot-checked at
+  # 'nspot' bins (evenly spaced, plus the peak of R) using DFT channel
+  # 'ch'. Raises RuntimeError if the stream delivers no waveforms.
+  #
+  # Returns (U,V,R,raw,check) -- 'check' as from 'crossCheck' (or None).
+  def scanDFTKernel(self, strm, ch=0, nwf=64, nspot=4):
+    nsmpls   = sv("NumSamples", self._path).getVal() + 1;
+    (wf, hd) = strm.readWaveforms( nwf )
+    try:
+      spec = self.spectrum( wf, nsmpls )
+    finally:
+      strm.releaseWaveforms( wf )
+    chk  = None
+    if nspot > 0:
+      bins = np.linspace( 0, nsmpls, nspot, endpoint = False ).astype('int64').tolist()
+      pk   = int( np.argmax( spec[2][0:nsmpls//2 + 1] ) )
+      if not pk in bins:
+        bins.append( pk )
+      chk  = self.crossCheck( spec, bins, ch )
+      for nm in [ "U", "V", "R" ]:
+        print("{}: scale {:10.4g}, residual {:7.2%}".format( nm, chk[nm][0], chk[nm][1] ))
+    return spec + ( chk, )
+
 defnam="/mmio/AppTop/AppCore/AmcBay1/Bpm"
 
 if __name__ == "__main__":
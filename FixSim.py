@@ -0,0 +1,146 @@
+#!/usr/bin/python3 -i
+
+# Offline fixed-point model of the BPM simulator's filter pipeline.
+#
+# The model consumes the coefficient arrays exactly as they are
+# downloaded to the firmware (LinSys.filterCoeffsDL(),
+# LinSys.polyCoeffsDL(); possibly zero-padded as done by bpm.SIM)
+# and computes the int16 waveform the simulator produces for a beam
+# pulse at a given fractional time-lag 'to' (0 <= to < 1).
+#
+# Arithmetic (all coefficients are 18-bit, 1.0 = 2**17):
+#
+#  - the numerator coefficients e5..e0 of every first-order system
+#    are computed from the polynomial coefficients by horner's
+#    scheme in x = 2*to - 1:  acc = (acc * x >> 17) + c
+#  - every first-order system is a pipelined recursion in z^3:
+#      y[n] = e(n) + (B1/2 * y[n-3] >> 16) + (B0 * y[n-6] >> 17)
+#    where e(n) = e5, e4, .., e0 for n = 1..6 (0 otherwise), i.e.,
+#    H(z) = (e5 z^5 + .. + e0)/(z^6 - B1 z^3 - B0)
+#  - products are truncated (arithmetic shift); the state of each
+#    recursion and the horner accumulator wrap around at 18 bits
+#  - the outputs of all first-order systems are summed and the result
+#    wraps around at 16 bits.
+#
+# These word widths and, in particular, the rounding conventions are
+# assumptions; they have not been verified against firmware output
+# (no reference vectors), i.e., this is NOT a bit-exact model of the
+# firmware. The largest deviation from the floating-point 'reference'
+# measured with the bpmSimInit setups (Fcav/Qcav/Ffil/Bfil; seeds 1..10,
+# 64 lags, 256 samples, all channels) is 14.2 LSB for the cavity and
+# 13.4 LSB for the stripline systems.
+#
+# Everything is vectorized across channels, first-order systems and
+# lags; only the time-recursion loops (in steps of 3 samples).
+
+import numpy as np
+
+def wrap(v, nbits):
+  m = 1 << nbits
+  h = 1 << (nbits - 1)
+  return ((v + h) & (m - 1)) - h
+
+# Split filter coefficients (..., 8*nP) into numerators
+# (..., nP, 6; highest power first), B0 and B1/2 (..., nP)
+def decodeFilterCoeffsDL(fdl):
+  fdl = np.asarray( fdl, 'int64' )
+  c   = fdl.reshape( fdl.shape[0:-1] + ( fdl.shape[-1]//8, 8 ) )
+  return ( c[..., 5::-1], c[..., 6], c[..., 7] )
+
+# Undo the pair-interleaving of the polynomial coefficients
+# (..., 6*(pOrd+1)*nP) -> (..., nP, 6, pOrd+1) (highest power first)
+def decodePolyCoeffsDL(pdl, nP):
+  pdl  = np.asarray( pdl, 'int64' )
+  lead = pdl.shape[0:-1]
+  nco  = pdl.shape[-1] // (6*nP)
+  c    = pdl.reshape( lead + ( 3*nP, nco, 2 ) )
+  c    = np.swapaxes( c, -1, -2 )
+  return c.reshape( lead + ( nP, 6, nco ) )
+
+# fixed-point representation of x = 2*to - 1
+def lagToX(lags):
+  x = np.round( ( 2.0*np.asarray( lags, 'float64' ) - 1.0 ) * 2**17 )
+  return np.array( np.minimum( x, 2**17 - 1 ), 'int64' )
+
+# Numerator coefficients for all lags: pc (..., nP, 6, pOrd+1)
+# -> (..., nlag, nP, 6)
+def hornerNumer(pc, lags):
+  x   = lagToX( np.atleast_1d( lags ) )
+  x   = x.reshape( x.shape + (1, 1) )
+  pc  = np.expand_dims( pc, -4 )
+  acc = np.broadcast_to( pc[..., 0], pc.shape[0:-4] + ( len(x), ) + pc.shape[-3:-1] ).copy()
+  for k in range( 1, pc.shape[-1] ):
+    acc = wrap( ( ( acc * x ) >> 17 ) + pc[..., k], 18 )
+  return acc
+
+# Run the recursions. 'numer' (..., nP, 6), b0/b1h broadcastable to
+# (..., nP). Returns the (wrapped) sum over all first-order systems
+# (..., nsmpls) as int16.
+def recurse(numer, b0, b1h, nsmpls):
+  nblk = ( nsmpls + 2 ) // 3 + 1
+  exc  = np.zeros( numer.shape[0:-1] + ( 3*nblk, ), 'int64' )
+  exc[..., 1:7] = numer
+  exc  = exc.reshape( numer.shape[0:-1] + ( nblk, 3 ) )
+  b0   = np.asarray( b0,  'int64' )[..., np.newaxis]
+  b1h  = np.asarray( b1h, 'int64' )[..., np.newaxis]
+  y1   = np.zeros( numer.shape[0:-1] + ( 3, ), 'int64' )  # y[n-3..n-1]
+  y2   = np.zeros( numer.shape[0:-1] + ( 3, ), 'int64' )  # y[n-6..n-4]
+  out  = np.zeros( numer.shape[0:-2] + ( nblk, 3 ), 'int64' )
+  for i in range( nblk ):
+    y  = wrap( exc[..., i, :] + ( ( b1h * y1 ) >> 16 ) + ( ( b0 * y2 ) >> 17 ), 18 )
+    out[..., i, :] = np.sum( y, -2 )
+    y2 = y1
+    y1 = y
+  out = out.reshape( out.shape[0:-2] + ( 3*nblk, ) )[..., 0:nsmpls]
+  return np.array( wrap( out, 16 ), 'int16' )
+
+# Simulate the waveforms for downloaded coefficients.
+#
+#   fdl:  filter coefficients, (8*nP,) or (nch, 8*nP)
+#   pdl:  polynomial coefficients, (6*(pOrd+1)*nP,) or (nch, ...);
+#         if None then the numerators held in 'fdl' are used (to = 0)
+#   lags: fractional time-lag(s) of the beam pulse
+#
+# Returns int16 array (nch, nlag, nsmpls) (leading dimension
+# omitted for 1-d inputs).
+def simulate(fdl, pdl = None, lags = 0.0, nsmpls = 256):
+  (numer, b0, b1h) = decodeFilterCoeffsDL( fdl )
+  nlag = len( np.atleast_1d( lags ) )
+  if None is pdl:
+    numer = np.broadcast_to( np.expand_dims( numer, -3 ), numer.shape[0:-2] + ( nlag, ) + numer.shape[-2:] )
+  else:
+    numer = hornerNumer( decodePolyCoeffsDL( pdl, b0.shape[-1] ), lags )
+  b0  = np.expand_dims( b0,  -2 )
+  b1h = np.expand_dims( b1h, -2 )
+  return recurse( numer, b0, b1h, nsmpls )
+
+def padTo(a, n):
+  p = np.zeros( n, 'int64' )
+  p[0:len(a)] = a
+  return p
+
+# Simulate a list of LinSys (one per channel) as downloaded by
+# bpm.SIM.fcal (i.e., zero-padded to the largest number of
+# first-order systems).
+def simulateSystems(lsysList, lags = 0.0, nsmpls = 256, order = -1):
+  fdl = [ l.filterCoeffsDL()      for l in lsysList ]
+  pdl = [ l.polyCoeffsDL( order ) for l in lsysList ]
+  nf  = max( [ len(c) for c in fdl ] )
+  np_ = max( [ len(c) for c in pdl ] )
+  fdl = np.array( [ padTo( c, nf  ) for c in fdl ] )
+  pdl = np.array( [ padTo( c, np_ ) for c in pdl ] )
+  return simulate( fdl, pdl, lags, nsmpls )
+
+# Floating-point reference for one LinSys (polynomial approximation
+# of the numerators, exact recursion), scaled like the fixed-point
+# output but without wrap-around.
+def reference(lsys, lag = 0.0, nsmpls = 256):
+  out = np.zeros( nsmpls )
+  for c in lsys.get():
+    e = c.numerApprox( np.array( [ lag ] ) )[0]
+    y = np.zeros( nsmpls + 6 )
+    for n in range( 1, nsmpls ):
+      x = e[n-1] if n <= 6 else 0.0
+      y[n+5] = x + c.getB1()*y[n+2] + c.getB0()*y[n-1]
+    out += y[5:5+nsmpls]
+  return out * 2**17
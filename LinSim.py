@@ -7,8 +7,80 @@
 #@ distributed except according to the terms contained in the LICENSE.txt file.
 
 import numpy             as np;
-import scipy.signal      as sig;
-import matplotlib.pyplot as plt;
+import hashlib
+import atexit
+import os
+
+# scipy.signal is only imported when first used; matplotlib only
+# by the plotting routines (sanityCheck) -- importing this module
+# has no side effects.
+class LazySignal_:
+  def __getattr__(self, nam):
+    global sig
+    import scipy.signal
+    sig = scipy.signal
+    return getattr( sig, nam )
+
+sig = LazySignal_()
+
+# Number of points (x = -1..1) at which the numerator is sampled
+# for the polynomial approximation
+polyFitPoints = 100
+
+def polyFitT(npts = polyFitPoints):
+  return (np.linspace(-1.,1.,npts) + 1)/2.
+
+_polyFitMats = dict()
+
+# Matrix which maps 'npts' samples (at x = -1..1) onto the
+# coefficients of the least-squares approximating polynomial
+# of 'order'. The fit is done in the chebyshev basis (better
+# conditioned) and converted to a 'normal' polynomial -- this is
+# numerically not optimal for evaluation but the firmware does it
+# this way (easier to implement horner than clenshaw). And it's not
+# a big deal for small order and well-behaved functions.
+# The coefficients are in 'signal/poly1d' layout (highest power
+# first). Matrices are cached.
+def polyFitMatrix(npts, order):
+  key = (npts, order)
+  try:
+    return _polyFitMats[key]
+  except KeyError:
+    pass
+  x   = np.linspace(-1.,1.,npts)
+  # chebyshev -> power basis (column k holds T_k)
+  c2p = np.zeros( (order+1, order+1) )
+  for k in range(order+1):
+    c2p[0:k+1,k] = np.polynomial.chebyshev.cheb2poly( np.eye(order+1)[k][0:k+1] )
+  M   = np.dot( c2p, np.linalg.pinv( np.polynomial.chebyshev.chebvander( x, order ) ) )
+  M   = M[::-1].copy()
+  _polyFitMats[key] = M
+  return M
+
+# Compute the polynomial approximations of all first-order systems
+# (of all LinSys objects) in 'systems' with a single matrix multiply.
+# 'systems' may contain 'LinSys' and/or 'firstOrderSys' objects.
+def fitPolyCoeffs(systems, order = -1):
+  ps = list()
+  for s in systems:
+    if isinstance(s, LinSys):
+      ps.extend( s.get() )
+    else:
+      ps.append( s )
+  ps = [ p for p in ps if not ( p.ord >= 0 and (order < 0 or order == p.ord) ) ]
+  if 0 == len(ps):
+    return
+  o    = order
+  if o < 0:
+    o = ps[0].dor
+  t    = polyFitT()
+  tabs = [ p.numer( t ) for p in ps ]
+  pc   = np.dot( polyFitMatrix( polyFitPoints, o ), np.concatenate( tabs, 1 ) ).transpose()
+  n    = 0
+  for (p, tab) in zip( ps, tabs ):
+    nc = tab.shape[1]
+    p.setPolyCoeffs( pc[n:n+nc], o )
+    n  = n + nc
 
 # real or complex first-order system
 class firstOrderSys:
@@ -29,6 +101,13 @@ class firstOrderSys:
     self.ord= polyOrder;
     self.dor= 4 # default order
 
+  # scale the residue (and thus the numerator) by 'f'; the
+  # polynomial approximation must be recomputed
+  def scale(self, f):
+    self.r   = self.r*f
+    self.N   = self.N*f
+    self.ord = -1
+
   def getB1(self):
     return self.B1
 
@@ -82,26 +161,17 @@ class firstOrderSys:
     if (order < 0):
       order = self.dor;
     # simulator uses x = {-1..1} = 2*t - 1 (t=0..1)
-    x     = np.linspace(-1.,1.,100)
-    t     = (x+1)/2.
-    tab   = self.numer( t )
-    coefs = list()
-    for col in tab.transpose():
-      cheb = np.polynomial.Chebyshev.fit(x, col, order)
-      # convert to 'normal' polynomial -- this is numerically
-      # not optimal for evaluation but the firmware does it
-      # this way (easier to implement horner than clenshaw).
-      # And it's not a big deal for small order and well-behaved
-      # functions.
-      # convert to 'alternate' polynomial representation
-      # which is used by numpy.signal :-(
-      coefs.append( cheb.convert( kind = np.polynomial.Polynomial ).coef[::-1] )
-    self.ord = order
-    self.pc  = np.array(coefs)
+    M     = polyFitMatrix( polyFitPoints, order )
+    tab   = self.numer( polyFitT() )
+    self.setPolyCoeffs( np.dot( M, tab ).transpose(), order )
     # coefficients are now in 'signal/poly1d' layout
     # (highest power first)
     return self.pc
 
+  def setPolyCoeffs(self, pc, order):
+    self.ord = order
+    self.pc  = pc
+
   # approximation of numer() in same layout
   def numerApprox(self, to = 0.):
     coef = self.polyCoeffs()
@@ -124,7 +194,10 @@ class LinSys:
   # Input: **analog** transfer function b(s)/a(s) with s normalized
   #        to the sampling frequency fs!
   #
-  def __init__(self, b, a, Ts=1.):
+  # With 'fit' False the polynomial approximations are not computed
+  # (nor checked); the caller must do so for a batch of systems with
+  # 'fitPolyCoeffs' followed by 'checkPolyResponse' (see mkLinSysList).
+  def __init__(self, b, a, Ts=1., fit=True):
     # multiple roots are not supported
     if ( np.any( sig.unique_roots( np.roots(a) )[1] > 1 ) ):
       raise("Roots with multiplicity > 1 not supported")
@@ -133,7 +206,7 @@ class LinSys:
 
     # Partial Fraction Decomposition
     (r, p, k) = sig.residue(b,a)
-    if ( k != 0. ):
+    if ( np.any( k != 0. ) ):
       raise("System with direct term not supported ATM")
 
 
@@ -146,15 +219,31 @@ class LinSys:
     self.PS = list()
     for rp in zip(r,P):
       self.PS.append( firstOrderSys(rp) )
-
-    # must make sure polynomial computation doesn't overflow
-    # NOTE: if there are multiple channels then all must be normalized
-    #       by the *same* number
-
+    if fit:
+      fitPolyCoeffs( self.PS )
+      self.checkPolyResponse()
+
+  # must make sure polynomial computation doesn't overflow
+  # NOTE: if there are multiple channels then all must be normalized
+  #       by the *same* number
+  def checkPolyResponse(self):
     maxResp = self.maxPolyResponse()
-    if self.maxPolyResponse() > 1.0:
+    if maxResp > 1.0:
       raise RuntimeError("Polynomial too large (would overflow); reduce numerator by", maxResp)
 
+  # Divide the numerator by 'norm'. The decomposition is reused (the
+  # residues scale with the numerator); only the polynomial
+  # approximations are recomputed (and checked, unless 'fit' is False).
+  def normalize(self, norm, fit=True):
+    self.b = self.b/norm
+    for ps in self.PS:
+      ps.scale( 1./norm )
+    self.__dict__.pop( 'pcDL_', None )
+    self.__dict__.pop( 'fcDL_', None )
+    if fit:
+      fitPolyCoeffs( self.PS )
+      self.checkPolyResponse()
+
   def get(self):
     return self.PS
 
@@ -169,8 +258,24 @@ class LinSys:
     for ps in self.PS:
       ps.dump()
 
+  # polynomial order used for 'order' (< 0: order of the current
+  # approximation or the default)
+  def effOrder_(self, order):
+    if order >= 0 or 0 == len(self.PS):
+      return order
+    if self.PS[0].ord >= 0:
+      return self.PS[0].ord
+    return self.PS[0].dor
+
   # Downloadable poly coeffs (list of 18-bit integers)
   def polyCoeffsDL(self, order=-1):
+    order = self.effOrder_( order )
+    try:
+      (o, dl) = self.pcDL_
+      if o == order:
+        return dl.copy()
+    except AttributeError:
+      pass
     # simulator needs coefficients in a different layout:
     #     [ aMN     a(M-1)N   aM(N-1) a(M-1)(N-1) .. aM0 a(M-1)0,
     #       a(M-1)N a(M-2)N   ...                                ]
@@ -191,7 +296,9 @@ class LinSys:
     allCoeffs = [ allCoeffs[i:i+2].transpose().flatten() for i in range(0,len(allCoeffs),2) ]
 
     # concatenate this list together, round and convert...
-    return np.array( np.round( 2**17 * np.concatenate(allCoeffs) ), 'int32' )
+    dl         = np.array( np.round( 2**17 * np.concatenate(allCoeffs) ), 'int32' )
+    self.pcDL_ = (order, dl)
+    return dl.copy()
 
   # Downloadable filter coeffs (list of 18-bit integers)
   # (need to invert the ordering of the numerator; highest-lag
@@ -200,9 +307,14 @@ class LinSys:
   # simulator; the valid range covers 0..2! and therefore B2
   # is normalized to 2^16 instead of 2^17.
   def filterCoeffsDL(self):
+    try:
+      return self.fcDL_.copy()
+    except AttributeError:
+      pass
     allCoeffs = np.concatenate( [ np.append(c.numer()[0][::-1], [c.getB0(), c.getB1()/2]) for c in self.get() ] )
-    allCoeffs = np.round( 2**17 * allCoeffs.flatten() )
-    return np.array( allCoeffs, 'int32' )
+    allCoeffs  = np.round( 2**17 * allCoeffs.flatten() )
+    self.fcDL_ = np.array( allCoeffs, 'int32' )
+    return self.fcDL_.copy()
 
   def maxPolyCoeff(self):
     return np.max( np.abs( [ c.polyCoeffs() for c in self.get() ] ) )
@@ -217,29 +329,177 @@ class LinSys:
   @staticmethod
   def create(N,fc,bw):
     [b,a]=sig.iirfilter(N,[fc-bw/2,fc+bw/2],analog=True)
+    return mkLinSys(b,a)
 
-    try:
-      lsys=LinSys( b,a )
-    except RuntimeError as e:
-      print("Normalized numerator dividing by {}!".format(e.args[1]))
-      b    = b/e.args[1]
-      lsys = LinSys(b,a)
+  # Rebuild a LinSys from a 'LinSysCache' entry (no synthesis)
+  @staticmethod
+  def fromCache(ent):
+    lsys        = LinSys.__new__( LinSys )
+    lsys.b      = ent['b'].copy()
+    lsys.a      = ent['a'].copy()
+    order       = int( ent['order'] )
+    lsys.PS     = list()
+    for (r, p, pc) in zip( ent['r'], ent['p'], ent['pc'] ):
+      ps = firstOrderSys( (r, p) )
+      ps.setPolyCoeffs( pc.copy(), order )
+      lsys.PS.append( ps )
+    lsys.pcDL_  = ( int( ent['dlOrder'] ), ent['pcDL'].copy() )
+    lsys.fcDL_  = ent['fcDL'].copy()
     return lsys
 
+# Memoization of synthesized systems. Entries are keyed by a hash
+# of the exact inputs (numerator, denominator, polynomial order)
+# and hold everything needed to recreate the LinSys without any
+# synthesis: (normalized) b/a, residues and poles of the first-order
+# systems, their polynomial coefficients and the download arrays.
+#
+# The cache may be attached to an '.npz' file; it is then loaded
+# immediately and saved (if modified) at exit or by 'save()'.
+class LinSysCache:
+  fields = [ 'b', 'a', 'r', 'p', 'pc', 'order', 'dlOrder', 'pcDL', 'fcDL' ]
+
+  def __init__(self, fnam = None):
+    self.ents_  = dict()
+    self.fnam_  = None
+    self.dirty_ = False
+    self.hits_  = 0
+    self.miss_  = 0
+    if None != fnam:
+      self.attach( fnam )
+
+  @staticmethod
+  def key(b, a, order = -1):
+    h = hashlib.sha1()
+    h.update( np.ascontiguousarray( b, 'float64' ).tobytes() )
+    h.update( b'/' )
+    h.update( np.ascontiguousarray( a, 'float64' ).tobytes() )
+    h.update( '/{:d}'.format( order ).encode() )
+    return h.hexdigest()
+
+  def lookup(self, key):
+    try:
+      ent = self.ents_[key]
+    except KeyError:
+      self.miss_ += 1
+      return None
+    self.hits_ += 1
+    return LinSys.fromCache( ent )
+
+  def add(self, key, lsys, order = -1):
+    ps  = lsys.get()
+    ent = dict()
+    ent['b']       = np.asarray( lsys.b, 'float64' )
+    ent['a']       = np.asarray( lsys.a, 'float64' )
+    ent['r']       = np.array( [ c.r for c in ps ] )
+    ent['p']       = np.array( [ c.p for c in ps ] )
+    ent['pc']      = np.array( [ c.polyCoeffs( order ) for c in ps ] )
+    ent['order']   = np.array( ps[0].ord )
+    ent['dlOrder'] = np.array( lsys.effOrder_( order ) )
+    ent['pcDL']    = lsys.polyCoeffsDL( order )
+    ent['fcDL']    = lsys.filterCoeffsDL()
+    self.ents_[key] = ent
+    self.dirty_     = True
+
+  def __len__(self):
+    return len( self.ents_ )
+
+  def clear(self):
+    self.ents_.clear()
+    self.dirty_ = True
+
+  # (hits, misses, entries)
+  def info(self):
+    return ( self.hits_, self.miss_, len( self.ents_ ) )
+
+  def attach(self, fnam):
+    if None == self.fnam_:
+      atexit.register( self.save )
+    self.fnam_ = fnam
+    if os.path.exists( fnam ):
+      self.load( fnam )
+
+  def load(self, fnam):
+    with np.load( fnam ) as d:
+      for nam in d.files:
+        (key, fld) = nam.split('.')
+        self.ents_.setdefault( key, dict() )[fld] = d[nam]
+    # drop incomplete entries
+    for key in [ k for (k, e) in self.ents_.items() if len( e ) != len( self.fields ) ]:
+      del self.ents_[key]
+
+  def save(self, fnam = None):
+    if None == fnam:
+      if None == self.fnam_ or not self.dirty_:
+        return
+      fnam = self.fnam_
+    arrs = dict()
+    for (key, ent) in self.ents_.items():
+      for fld in self.fields:
+        arrs[key + "." + fld] = ent[fld]
+    tmp = fnam + ".tmp{}.npz".format( os.getpid() )
+    np.savez( tmp, **arrs )
+    os.replace( tmp, fnam )
+    if fnam == self.fnam_:
+      self.dirty_ = False
+
+_linSysCache = LinSysCache()
+
+def linSysCache():
+  return _linSysCache
+
+# Check the (fitted) polynomial approximations of 'lsys' and
+# normalize its numerator if they would overflow.
+def checkOrNormalize_(lsys):
+  try:
+    lsys.checkPolyResponse()
+  except RuntimeError as e:
+    norm = e.args[1]*1.001
+    print("Normalized numerator dividing by {}!".format(norm))
+    lsys.normalize( norm )
+  return lsys
+
+# Create a LinSys from b/a, normalizing the numerator if the
+# polynomial approximation would overflow. Results are memoized
+# in the LinSysCache (if 'cache' is True).
+def mkLinSys(b, a, order = -1, cache = True):
+  if cache:
+    key  = LinSysCache.key( b, a, order )
+    lsys = _linSysCache.lookup( key )
+    if None != lsys:
+      return lsys
+  lsys = LinSys( b, a, fit = False )
+  fitPolyCoeffs( [ lsys ] )
+  checkOrNormalize_( lsys )
+  if cache:
+    _linSysCache.add( key, lsys, order )
+  return lsys
+
 def mkResonator(fo,Q):
   wo = 2*np.pi*fo
   b  =    [wo/Q,     0]
   a  = [1, wo/Q, wo**2]
   return (b,a)
 
-def mkCavitySystem(fo_r, Q_r, fo_f, bw_f, ord_f=4, nsys=4, tol_fo_f=0.0, tol_fo_r=0.01):
-  return mkSystem(fo_r, Q_r, fo_f, bw_f, ord_f, nsys, tol_fo_f, tol_fo_r)
+def mkCavitySystem(fo_r, Q_r, fo_f, bw_f, ord_f=4, nsys=4, tol_fo_f=0.0, tol_fo_r=0.01, seed=None, workers=None):
+  return mkSystem(fo_r, Q_r, fo_f, bw_f, ord_f, nsys, tol_fo_f, tol_fo_r, seed, workers)
 
-def mkStriplineSystem(fo_f, bw_f, ord_f=4, nsys=4, tol_fo_f=0.01):
-  return mkSystem(0.0, 0.0, fo_f, bw_f, ord_f, nsys, tol_fo_f)
+def mkStriplineSystem(fo_f, bw_f, ord_f=4, nsys=4, tol_fo_f=0.01, seed=None, workers=None):
+  return mkSystem(0.0, 0.0, fo_f, bw_f, ord_f, nsys, tol_fo_f, 0.0, seed, workers)
 
+# Convert 'seed' (None, int or SeedSequence) into a SeedSequence.
+# If no seed is given then one is drawn from the global numpy
+# random state (so that np.random.seed() still yields reproducible
+# results).
+def seedSequence(seed = None):
+  if isinstance(seed, np.random.SeedSequence):
+    return seed
+  if None == seed:
+    seed = np.random.randint(0, 2**31-1)
+  return np.random.SeedSequence( seed )
 
-def mkSystem(fo_r, Q_r, fo_f, bw_f, ord_f=5, nsys = 4, tol_fo_f=0.0, tol_fo_r=0.0):
+# analog transfer functions (b,a) of all channels; each channel
+# draws its tolerances from its own generator (spawned from 'seed')
+def mkSystemBA(fo_r, Q_r, fo_f, bw_f, ord_f=5, nsys = 4, tol_fo_f=0.0, tol_fo_r=0.0, seed=None):
 
   if ( abs(tol_fo_f) > 0.05 ):
     raise RuntimeError("-.05 < tol_fo_f < +.05")
@@ -252,11 +512,12 @@ def mkSystem(fo_r, Q_r, fo_f, bw_f, ord_f=5, nsys = 4, tol_fo_f=0.0, tol_fo_r=0.
     fo_r = [fo_r for i in range(nsys)]
     Q_r  = [Q_r  for i in range(nsys)]
 
-  lsys_list = []
+  ba_list = []
 
-  for i in range(nsys):
-    fo_f_i = fo_f*(1.0 +  tol_fo_f*np.random.randn())
-    fo_r_i = fo_r[i]*(1.0 +  tol_fo_r*np.random.randn())
+  for (i, ss) in enumerate( seedSequence( seed ).spawn( nsys ) ):
+    rng    = np.random.default_rng( ss )
+    fo_f_i = fo_f*(1.0 +  tol_fo_f*rng.standard_normal())
+    fo_r_i = fo_r[i]*(1.0 +  tol_fo_r*rng.standard_normal())
     [bf,af] = sig.iirfilter(ord_f, 2*np.pi*np.array([fo_f_i-bw_f/2,fo_f_i+bw_f/2]), rp=0.5, ftype='cheby1', analog=True)
     if fo_r[i] > 0.0:
       [br,ar] = mkResonator(fo_r_i, Q_r[i])
@@ -265,18 +526,73 @@ def mkSystem(fo_r, Q_r, fo_f, bw_f, ord_f=5, nsys = 4, tol_fo_f=0.0, tol_fo_r=0.
     else:
       bsys = bf
       asys = af
-    try:
-      lsys=LinSys( bsys,asys )
-    except RuntimeError as e:
-      norm = e.args[1]*1.001
-      print("Normalized numerator dividing by {}!".format(norm))
-      bsys = bsys/norm
-      lsys = LinSys(bsys,asys)
-    lsys_list.append(lsys)
-  return lsys_list
+    ba_list.append( (bsys, asys) )
+  return ba_list
+
+# Synthesize a list of (b,a) pairs (no caching); the polynomial
+# approximations of all of them are fitted in one go. Systems which
+# would overflow are normalized (and refitted individually).
+def mkLinSysBatch_(ba_list):
+  res = [ LinSys( b, a, fit = False ) for (b, a) in ba_list ]
+  fitPolyCoeffs( res )
+  return [ checkOrNormalize_( lsys ) for lsys in res ]
+
+# Number of systems fitted per 'mkLinSysBatch_' call. The same column
+# set must always be fitted by the same matrix multiply (the result of
+# a column may depend on how the BLAS partitions the product) -- the
+# serial and parallel paths therefore both split the work into batches
+# of this size.
+linSysBatch = 4
+
+# Create LinSys objects for a list of (b,a) pairs. Systems not found
+# in the LinSysCache are synthesized in a pool of 'workers' processes
+# (0: one per CPU; None: serially in this process). The workers are
+# spawned (rather than forked from a possibly multithreaded process);
+# scripts using this must keep their work under 'if __name__ == "__main__"'.
+def mkLinSysList(ba_list, workers=None):
+  keys = [ LinSysCache.key( b, a ) for (b, a) in ba_list ]
+  res  = [ _linSysCache.lookup( k ) for k in keys ]
+  miss = [ i for i in range( len( res ) ) if None == res[i] ]
+  # (the misses are counted by the lookup above; synthesize without
+  # looking up again)
+  bats = [ [ ba_list[i] for i in miss[j:j+linSysBatch] ] for j in range( 0, len( miss ), linSysBatch ) ]
+  if None == workers or len( bats ) < 2:
+    done = map( mkLinSysBatch_, bats )
+  else:
+    import concurrent.futures
+    import multiprocessing
+    if 0 == workers:
+      workers = os.cpu_count()
+    ctx = multiprocessing.get_context( "spawn" )
+    with concurrent.futures.ProcessPoolExecutor( max_workers = workers, mp_context = ctx ) as pool:
+      done = list( pool.map( mkLinSysBatch_, bats ) )
+  for (i, lsys) in zip( miss, [ lsys for bat in done for lsys in bat ] ):
+    _linSysCache.add( keys[i], lsys )
+    res[i] = lsys
+  return res
+
+# 'seed' makes the toleranced channels reproducible; serial and
+# parallel ('workers', see mkLinSysList) synthesis yield bit-identical
+# coefficients.
+def mkSystem(fo_r, Q_r, fo_f, bw_f, ord_f=5, nsys = 4, tol_fo_f=0.0, tol_fo_r=0.0, seed=None, workers=None):
+  return mkLinSysList( mkSystemBA( fo_r, Q_r, fo_f, bw_f, ord_f, nsys, tol_fo_f, tol_fo_r, seed ), workers )
+
+# Synthesize several configurations (e.g., one per bay) in one go;
+# 'cfgs' is a list of dictionaries with 'mkSystem' keyword arguments
+# (excluding 'seed' and 'workers'). Each configuration gets its own
+# seed spawned from 'seed'. Returns a list of LinSys lists.
+def mkSystems(cfgs, seed=None, workers=None):
+  ba_lists = [ mkSystemBA( seed = ss, **cfg ) for (cfg, ss) in zip( cfgs, seedSequence( seed ).spawn( len( cfgs ) ) ) ]
+  lsys     = mkLinSysList( [ ba for l in ba_lists for ba in l ], workers )
+  res      = []
+  for l in ba_lists:
+    res.append( lsys[0:len(l)] )
+    lsys = lsys[len(l):]
+  return res
 
 # fc, bw are angular frequencies, i.e., 2*%pi*fc*Ts (Ts defaults to 1.0)
 def sanityCheck(N=8, fc=2*np.pi*0.25, bw=2*np.pi*0.2):
+  import matplotlib.pyplot as plt
   cc    = LinSys.create(N,fc,bw);
   (b,a) = cc.getBA()
 
@@ -312,6 +628,7 @@ def sanityCheck(N=8, fc=2*np.pi*0.25, bw=2*np.pi*0.2):
   plt.show()
   return cc
 
-cc=sanityCheck()
-cc.dump()
-#sanityCheck().dump()
+if __name__ == "__main__":
+  cc=sanityCheck()
+  cc.dump()
+  #sanityCheck().dump()
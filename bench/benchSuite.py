@@ -0,0 +1,452 @@
+#!/usr/bin/python3
+
+# Offline benchmark suite (no hardware; 'pycpsw' is replaced by
+# mockCpsw). Covers
+#
+#   stream.*  : BpmStream.parseMsg / parseMsgs / read / readWaveforms on
+#               synthetic packets
+#   linsim.*  : LinSys synthesis and download arrays for the cavity and
+#               stripline setups used by bpmSimInit
+#   pathgrep.*: index build and queries on a large generated hierarchy
+#   sim.*     : bpm.SIM.fcal transaction counts against a mock BPM
+#   cav.*     : CavityBpm.scanDFT / scanDFTKernel transaction counts against a mock BPM
+#   log.*     : register-write log written by logOn loads back (round trip)
+#               and is complete if the script exits without logOff
+#
+# Timings ('s') are the best of '-n' repetitions; counts ('n') are exact.
+#
+#   python3 bench/benchSuite.py [-n reps] [-k substring] [-o results.json]
+#                               [-b baseline.json] [-t tolerance] [-u] [-T]
+#
+# The results are written to '-o' (JSON) and compared with the
+# baseline (default: bench/baseline.json). Counts which changed at
+# all are flagged and make the exit status non-zero. Timings depend
+# on the host; they are compared relative to a calibration loop which
+# is timed in the same run (and in the baseline's) and flagged if the
+# ratio grew by more than the tolerance (default 0.25, i.e., 25%) --
+# this is advisory only unless '-T' is given. '-u' stores the results
+# as the new baseline.
+
+import io
+import os
+import sys
+import json
+import contextlib
+import time
+import getopt
+import tempfile
+import platform
+import subprocess
+import numpy as np
+
+topDir  = os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) )
+sys.path.insert( 0, topDir )
+
+import mockCpsw
+mockCpsw.install()
+
+import LinSim
+import pathGrep
+import bpmMiscUtils
+import bpm
+from   BpmStream import BpmStream
+from   CavityBpm import CavityBpm
+from   mockCpsw  import MockHub, Path
+
+defBaseline = os.path.join( topDir, "bench", "baseline.json" )
+
+# Setup of bpmSimInit.py
+fs   = 370.
+Fcav = [0, 38.2/fs , 30.3/fs  , 37.2/fs ]
+Qcav = [0, 38.2/2.1, 30.3/1.25, 37.2/3.3]
+Ffil = (49.2+22.3)/2/fs
+Bfil = (49.2-22.3)/fs
+
+def bestOf(fn, nrep, setup = None):
+  best = None
+  for i in range(nrep):
+    if None != setup:
+      arg = setup()
+      t0  = time.perf_counter()
+      fn( arg )
+    else:
+      t0  = time.perf_counter()
+      fn()
+    dt = time.perf_counter() - t0
+    if None == best or dt < best:
+      best = dt
+  return best
+
+def tm(v):
+  return { "value": v, "unit": "s" }
+
+def cnt(v):
+  return { "value": int(v), "unit": "n" }
+
+# Synthetic stream packets
+
+def mkPackets(n, seed = 0):
+  rng  = np.random.default_rng( seed )
+  buf  = BpmStream.bufAlloc( n )
+  hdr  = buf[:, 0:16].view( BpmStream.hdrDtype )[:, 0]
+  hdr['w0']   = 3 << 4     # 16-word header
+  hdr['stat'] = rng.integers( 0, 4, n )
+  hdr['tmit'] = rng.integers( 0, 1 << 20, n )
+  hdr['x']    = rng.integers( -1 << 20, 1 << 20, n )
+  hdr['y']    = rng.integers( -1 << 20, 1 << 20, n )
+  hdr['pid']  = 1000000 + np.arange( n )
+  buf[:, 16:16+512] = rng.integers( -1 << 15, 1 << 15, (n, 512) )
+  lens = np.full( n, 2*(16 + 512), 'int32' )
+  return ( buf, lens )
+
+def benchStream(nrep):
+  res          = dict()
+  (buf, lens)  = mkPackets( 4096 )
+  # (per-packet parser on python ints; int16 rows overflow its shifts under numpy 2)
+  rows         = [ b[0:16].tolist() for b in buf[0:1000] ]
+  res["stream.parseMsg.1000"]    = tm( bestOf( lambda: [ BpmStream.parseMsg( b ) for b in rows ], nrep ) )
+  res["stream.parseMsgs.4096"]   = tm( bestOf( lambda: BpmStream.parseMsgs( buf, lens ), nrep ) )
+  top  = MockHub("root")
+  frms = [ buf[i, 0:lens[i]//2].tobytes() for i in range( len(buf) ) ]
+  pos  = [ 0 ]
+  def src():
+    pos[0] = ( pos[0] + 1 ) % len(frms)
+    return frms[pos[0]]
+  top.stream( "Stream", source = src )
+  s    = BpmStream( Path.create( top ).findByName("Stream") )
+  rbuf = BpmStream.bufAlloc( 4096 )
+  rlen = np.zeros( 4096, 'int32' )
+  res["stream.read.4096"]        = tm( bestOf( lambda: s.read( rbuf, 4096, rlen ), nrep ) )
+  wf   = s.readWaveforms( 4096 )[0]
+  res["stream.readWaveforms.4096"] = tm( bestOf( lambda: s.readWaveforms( 4096, wf ), nrep ) )
+  return res
+
+# LinSim
+
+def clearCache():
+  LinSim.linSysCache().clear()
+
+def benchLinSim(nrep):
+  res = dict()
+  cav = lambda: LinSim.mkCavitySystem( Fcav, Qcav, Ffil, Bfil, seed = 1 )
+  stl = lambda: LinSim.mkStriplineSystem( Ffil, Bfil, seed = 1 )
+  res["linsim.cavity.synth"]     = tm( bestOf( lambda x: cav(), nrep, clearCache ) )
+  res["linsim.stripline.synth"]  = tm( bestOf( lambda x: stl(), nrep, clearCache ) )
+  res["linsim.cavity.cached"]    = tm( bestOf( cav, nrep ) )
+  bas = LinSim.mkSystemBA( Fcav, Qcav, Ffil, Bfil, 4, 4, 0.0, 0.01, seed = 1 )
+  fresh = lambda: [ LinSim.mkLinSys( b, a, cache = False ) for (b, a) in bas ]
+  res["linsim.cavity.dl"]        = tm( bestOf( lambda l: [ ( s.polyCoeffsDL(), s.filterCoeffsDL() ) for s in l ], nrep, fresh ) )
+  # serial and parallel synthesis must agree exactly
+  cfgs = [ dict( fo_r = Fcav, Q_r = Qcav, fo_f = Ffil, bw_f = Bfil, ord_f = 4, tol_fo_r = 0.01 ),
+           dict( fo_r = 0.0,  Q_r = 0.0,  fo_f = Ffil, bw_f = Bfil, ord_f = 4, tol_fo_f = 0.01 ) ]
+  pcs  = lambda ll: [ p.polyCoeffs() for l in ll for s in l for p in s.get() ]
+  clearCache()
+  ser  = pcs( LinSim.mkSystems( cfgs, seed = 1 ) )
+  clearCache()
+  par  = pcs( LinSim.mkSystems( cfgs, seed = 1, workers = 2 ) )
+  clearCache()
+  res["linsim.parallel.mismatches"] = cnt( len( ser ) - sum( [ np.array_equal( a, b ) for (a, b) in zip( ser, par ) ] ) )
+  return res
+
+# PathGrep on a generated hierarchy: 'fanout' hubs per level (every
+# other one an array of 4), 'nregs' registers per leaf hub.
+
+def mkHierarchy(depth = 4, fanout = 6, nregs = 10):
+  top = MockHub("root")
+  def fill(hub, lvl):
+    if lvl == depth:
+      for i in range(nregs):
+        hub.field( "Reg{:d}".format(i), nelms = 1 + 7*(i % 2) )
+      return
+    for i in range(fanout):
+      fill( hub.hub( "Dev{:d}".format(i), nelms = 1 + 3*(i % 2) ), lvl + 1 )
+  fill( top.hub("mmio"), 0 )
+  return Path.create( top )
+
+def benchPathGrep(nrep):
+  res  = dict()
+  mockCpsw.exploreElements = False
+  root = mkHierarchy()
+  idx  = pathGrep.PathIndex().build( root )
+  res["pathgrep.paths"]          = cnt( len(idx) )
+  res["pathgrep.build"]          = tm( bestOf( lambda: pathGrep.PathIndex().build( root ), nrep ) )
+  pg   = pathGrep.PathGrep( root )
+  pg.getIndex()
+  res["pathgrep.search"]         = tm( bestOf( lambda: pg( "Dev3[^/]*/.*/Reg7[^/]*$" ), nrep ) )
+  res["pathgrep.prefix"]         = tm( bestOf( lambda: pg.prefix( "/mmio/Dev2/Dev1[0-3]" ), nrep ) )
+  res["pathgrep.leaf"]           = tm( bestOf( lambda: pg.leaf( "Reg5" ), nrep ) )
+  res["pathgrep.leaf.matches"]   = cnt( len( pg.leaf( "Reg5" ) ) )
+  return res
+
+# Mock BPM (simulator with 4 channels, FIFO and DFT diagnostics)
+
+nPZ  = 4
+nPO  = 2
+pOrd = 4
+
+def mkBpm(nsmpls = 64):
+  top = MockHub("NetIODev")
+  app = top.hub("mmio").hub("AppTop").hub("AppCore")
+  sim = app.hub("BpmSim", nelms = 2)
+  sim.field("NumRx",       init = 4, mode = "RO")
+  sim.field("Command",     enums = [ ("Halt", 0), ("Run", 1), ("OneShot", 2) ], init = "Run")
+  sim.field("PeriodInt")
+  sim.field("PeriodFract")
+  chn = sim.hub("Channels", nelms = 4)
+  chn.field("NumPolesAndZeros", init = nPZ,  mode = "RO")
+  chn.field("NumPolesOnly",     init = nPO,  mode = "RO")
+  chn.field("PolyOrder",        init = pOrd, mode = "RO")
+  chn.field("FilterCoeffs",     nelms = 8*(nPZ + nPO),            sizeBits = 18, isSigned = True)
+  chn.field("PolyCoeffs",       nelms = 6*(pOrd + 1)*(nPZ + nPO), sizeBits = 18, isSigned = True)
+  fifo = app.hub("FifoRx")
+  fifo.field("SlotsFilled", mode = "RO")
+  fifo.field("RxData",      mode = "RO", sizeBits = 16, isSigned = True)
+  b = app.hub("AmcBay1").hub("Bpm")
+  b.field("FirmwareConfiguration", enums = [ ("CavityBpm", 0), ("StriplineBpm", 1) ], mode = "RO")
+  b.field("ComplexU", mode = "RO")
+  b.field("ComplexV", mode = "RO")
+  b.field("NumSamples", init = nsmpls - 1, mode = "RO")
+  for nm in [ "DFTScaleR", "DFTScaleU", "DFTScaleV" ]:
+    b.field( nm )
+  dft = b.hub("DFTChannels", nelms = 4)
+  for nm in [ "Coeff2C1", "Coeff2S1", "Coeff2C2", "Coeff2C4", "CoeffHU_Im", "CoeffHU_Re", "CoeffHV_Im", "CoeffHV_Re" ]:
+    dft.field( nm, sizeBits = 18, isSigned = True )
+  dia = b.hub("DFTDiagChannels", nelms = 4)
+  for nm in [ "DFT_R", "DFT_U", "DFT_V" ]:
+    dia.field( nm, mode = "RO" )
+  (buf, lens) = mkPackets( 1 )
+  frm = buf[0, 0:lens[0]//2].tobytes()
+  top.stream("BPM_A_Stream", source = lambda: frm)
+  return Path.create( top )
+
+# (the scripts look up per-element paths such as 'BpmSim[0]')
+def useRoot(root):
+  mockCpsw.exploreElements = True
+  bpmMiscUtils.setRoot( root )
+
+def counts(pfx, res, ntr = None):
+  st = mockCpsw.getStats()
+  res[pfx + ".reads"]  = cnt( st["reads"] )
+  res[pfx + ".writes"] = cnt( st["writes"] )
+  if None != ntr:
+    res[pfx + ".transactions"] = cnt( ntr )
+  mockCpsw.resetStats()
+
+def benchSim(nrep):
+  res  = dict()
+  useRoot( mkBpm() )
+  modl = LinSim.mkCavitySystem( Fcav, Qcav, Ffil, Bfil, seed = 1 )
+  othr = LinSim.mkCavitySystem( Fcav, Qcav, Ffil, Bfil, seed = 2 )
+  mockCpsw.resetStats()
+  s    = bpm.SIM( 0 )
+  counts( "sim.init", res )
+  counts( "sim.fcal.full", res, s.fcal( modl ) )
+  counts( "sim.fcal.same", res, s.fcal( modl ) )
+  chg    = list( modl )
+  chg[2] = othr[2]
+  counts( "sim.fcal.onechannel", res, s.fcal( chg ) )
+  res["sim.fcal.full.time"] = tm( bestOf( lambda: s.fcal( modl, force = True ), nrep ) )
+  mockCpsw.resetStats()
+  return res
+
+def benchCav(nrep):
+  res = dict()
+  root = mkBpm()
+  useRoot( root )
+  cav = CavityBpm( root.findByName("mmio/AppTop/AppCore/AmcBay1/Bpm") )
+  mockCpsw.resetStats()
+  cav.scanDFT( 0 )
+  counts( "cav.scanDFT.1ch", res )
+  cav.scanDFT( [0, 1, 2, 3] )
+  counts( "cav.scanDFT.4ch", res )
+  res["cav.scanDFT.4ch.time"] = tm( bestOf( lambda: cav.scanDFT( [0, 1, 2, 3] ), nrep ) )
+  strm = BpmStream( root.findByName("BPM_A_Stream") )
+  mockCpsw.resetStats()
+  with contextlib.redirect_stdout( io.StringIO() ):
+    cav.scanDFTKernel( strm, nwf = 64 )
+    counts( "cav.scanDFTKernel", res )
+    res["cav.scanDFTKernel.time"] = tm( bestOf( lambda: cav.scanDFTKernel( strm, nwf = 64 ), nrep ) )
+  mockCpsw.resetStats()
+  return res
+
+# Register-write log round trip: log the writes of 'fcal' (arrays,
+# index ranges, single elements) and of scalar registers, load the log
+# into a fresh BPM (as 'lconf' does) and compare the registers.
+def benchLog(nrep):
+  res  = dict()
+  root = mkBpm()
+  useRoot( root )
+  modl = LinSim.mkCavitySystem( Fcav, Qcav, Ffil, Bfil, seed = 1 )
+  s    = bpm.SIM( 0 )
+  fnam = os.path.join( tempfile.mkdtemp(), "log.yaml" )
+  bpmMiscUtils.logOn( fnam )
+  s.fcal( modl )
+  fc    = s.fc( 1 )
+  vals  = s.shadow_[ fc.getPath().toString() ].copy()
+  vals[5] += 1
+  s.setPaddedIncr( fc, vals )
+  s.getBpm().set( "PeriodInt", 123 )
+  s.getBpm().set( "Command", "Halt" )
+  bpmMiscUtils.logOff()
+  with open( fnam ) as f:
+    res["log.roundtrip.records"] = cnt( len( f.readlines() ) )
+  cpy  = mkBpm()
+  res["log.roundtrip.applied"]   = cnt( cpy.findByName("mmio").loadConfigFromYamlFile( fnam ) )
+  nbad = 0
+  for nam in pathGrep.PathGrep( root )( "(FilterCoeffs|PolyCoeffs|PeriodInt|Command)$" ):
+    a = mockCpsw.ScalVal_RO.create( root.findByName( nam ) ).getVal()
+    b = mockCpsw.ScalVal_RO.create( cpy.findByName(  nam ) ).getVal()
+    if not np.array_equal( a, b ):
+      nbad += 1
+  res["log.roundtrip.mismatches"] = cnt( nbad )
+  # a script which raises before 'logOff' still leaves a complete log
+  prog = "\n".join( [ "import sys",
+                      "sys.path.insert( 0, {!r} )".format( topDir ),
+                      "import mockCpsw",
+                      "mockCpsw.install()",
+                      "import bpmMiscUtils",
+                      "bpmMiscUtils.logOn( {!r} )".format( fnam ),
+                      "for i in range( 1000 ):",
+                      "  bpmMiscUtils.plog( 'rec', i )",
+                      "raise SystemExit( 1 )" ] )
+  subprocess.run( [ sys.executable, "-c", prog ] )
+  with open( fnam ) as f:
+    res["log.atexit.records"] = cnt( len( f.readlines() ) )
+  os.unlink( fnam )
+  os.rmdir( os.path.dirname( fnam ) )
+  mockCpsw.resetStats()
+  return res
+
+benchmarks = [ ( "stream",   benchStream   ),
+               ( "linsim",   benchLinSim   ),
+               ( "pathgrep", benchPathGrep ),
+               ( "sim",      benchSim      ),
+               ( "cav",      benchCav      ),
+               ( "log",      benchLog      ) ]
+
+# Fixed mix of interpreter and numpy work; timings are compared in
+# units of this loop's time on the same host (best of the runs before
+# and after the benchmarks).
+def calibrate(nrep = 5):
+  rng = np.random.default_rng( 0 )
+  a   = rng.normal( size = 1 << 16 )
+  def work():
+    acc = 0
+    for i in range( 100000 ):
+      acc += i & 7
+    np.sort( a )
+    np.fft.fft( a )
+    return acc
+  return bestOf( work, nrep )
+
+def gitRev():
+  try:
+    r = subprocess.run( [ "git", "rev-parse", "--short", "HEAD" ], cwd = topDir,
+                        stdout = subprocess.PIPE, stderr = subprocess.DEVNULL )
+    return r.stdout.decode().strip()
+  except OSError:
+    return None
+
+def run(nrep = 5, sel = None):
+  res = dict()
+  cal = calibrate( max( nrep, 20 ) )
+  for (nam, fn) in benchmarks:
+    if None != sel and not sel in nam:
+      continue
+    res.update( fn( nrep ) )
+  if None != sel:
+    res = dict( [ (k, v) for (k, v) in res.items() if sel in k ] )
+  meta = { "rev"     : gitRev(),
+           "date"    : time.strftime("%Y-%m-%dT%H:%M:%S"),
+           "host"    : platform.node(),
+           "python"  : platform.python_version(),
+           "numpy"   : np.__version__,
+           "nrep"    : nrep,
+           "calib"   : min( cal, calibrate( max( nrep, 20 ) ) ) }
+  return { "meta": meta, "results": res }
+
+# Compare 'cur' against 'ref'; returns list of (name, cur, ref, ratio, flag).
+# The ratio of timings is normalized by the ratio of the calibration
+# loops (if both runs have one).
+def compare(cur, ref, tol = 0.25):
+  rows = []
+  scl  = 1.0
+  if None != ref:
+    (cc, rc) = ( cur["meta"].get( "calib" ), ref["meta"].get( "calib" ) )
+    if None != cc and None != rc and cc > 0:
+      scl = rc/cc
+  for (k, c) in sorted( cur["results"].items() ):
+    r = ref["results"].get( k ) if None != ref else None
+    if None == r:
+      rows.append( ( k, c, None, None, "" ) )
+      continue
+    if c["unit"] == "n":
+      flag = "CHANGED" if c["value"] != r["value"] else ""
+      rat  = None
+    else:
+      rat  = scl*c["value"]/r["value"] if r["value"] > 0 else None
+      flag = "SLOWER" if None != rat and rat > 1.0 + tol else ""
+    rows.append( ( k, c, r, rat, flag ) )
+  return rows
+
+def fmtVal(v):
+  if None == v:
+    return "{:>12s}".format("-")
+  if v["unit"] == "n":
+    return "{:12d}".format( v["value"] )
+  return "{:10.3f}ms".format( v["value"]*1.0E3 )
+
+def report(rows, cur = None, ref = None):
+  if None != cur and None != ref and None != ref["meta"].get( "calib" ):
+    print("calibration loop: {:.3f}ms now, {:.3f}ms baseline (timing ratios are relative to it)".format(
+          cur["meta"]["calib"]*1.0E3, ref["meta"]["calib"]*1.0E3 ))
+  print("{:<32s} {:>12s} {:>12s} {:>7s}".format("benchmark", "now", "baseline", "ratio"))
+  for (k, c, r, rat, flag) in rows:
+    print("{:<32s} {} {} {:>7s} {}".format( k, fmtVal( c ), fmtVal( r ), "" if None == rat else "{:7.2f}".format( rat ), flag ))
+
+def usage(nm):
+  print("Usage: {} [-n reps] [-k substring] [-o results.json] [-b baseline.json] [-t tolerance] [-u] [-T] [-h]".format( nm ))
+
+if __name__ == "__main__":
+  opts, args = getopt.getopt( sys.argv[1:], "n:k:o:b:t:uTh" )
+  nrep = 5
+  sel  = None
+  onam = None
+  bnam = defBaseline
+  tol  = 0.25
+  upd  = False
+  gate = [ "CHANGED" ]
+  for opt,arg in opts:
+    if   opt == "-n":
+      nrep = int(arg)
+    elif opt == "-k":
+      sel  = arg
+    elif opt == "-o":
+      onam = arg
+    elif opt == "-b":
+      bnam = arg
+    elif opt == "-t":
+      tol  = float(arg)
+    elif opt == "-u":
+      upd  = True
+    elif opt == "-T":
+      gate.append( "SLOWER" )
+    elif opt == "-h":
+      usage( sys.argv[0] )
+      sys.exit(0)
+  cur = run( nrep, sel )
+  if None != onam:
+    with open( onam, "w" ) as f:
+      json.dump( cur, f, indent = 2, sort_keys = True )
+  ref = None
+  if os.path.exists( bnam ):
+    with open( bnam ) as f:
+      ref = json.load( f )
+  rows = compare( cur, ref, tol )
+  report( rows, cur, ref )
+  if upd:
+    with open( bnam, "w" ) as f:
+      json.dump( cur, f, indent = 2, sort_keys = True )
+    print("Baseline written to {}".format( bnam ))
+  elif any( [ row[4] in gate for row in rows ] ):
+    sys.exit(1)
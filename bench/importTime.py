@@ -0,0 +1,79 @@
+#!/usr/bin/python3
+
+# Import-time benchmark: measures (in fresh interpreters) how long
+# importing the scripts' modules takes on a headless node
+# (MPLBACKEND=Agg, no display).
+#
+#   python3 bench/importTime.py [-n repetitions] [-r git_revision] [module ...]
+#
+# With '-r' the same modules are also imported from a checkout of
+# the given revision (extracted with 'git archive') for comparison.
+# Modules which cannot be imported (e.g., because 'pycpsw' is not
+# installed) are reported as such.
+
+import os
+import sys
+import getopt
+import subprocess
+import tempfile
+import time
+
+topDir  = os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) )
+modules = [ "LinSim", "FixSim", "BpmStream", "bpmMiscUtils", "bpm" ]
+
+def importTime(mod, srcDir, nrep):
+  env = dict( os.environ )
+  env["MPLBACKEND"] = "Agg"
+  env.pop( "DISPLAY", None )
+  best = None
+  for i in range(nrep):
+    t0 = time.monotonic()
+    r  = subprocess.run( [ sys.executable, "-c", "import {}".format(mod) ],
+                         cwd = srcDir, env = env, stdout = subprocess.DEVNULL, stderr = subprocess.PIPE )
+    dt = time.monotonic() - t0
+    if 0 != r.returncode:
+      return ( None, r.stderr.decode().strip().split("\n")[-1] )
+    if None == best or dt < best:
+      best = dt
+  return ( best, None )
+
+def measure(srcDir, mods, nrep):
+  return dict( [ ( m, importTime( m, srcDir, nrep ) ) for m in mods ] )
+
+def fmt(res):
+  if None == res[0]:
+    return "{:>10s}".format("n/a")
+  return "{:10.3f}".format(res[0])
+
+if __name__ == "__main__":
+  opts, args = getopt.getopt( sys.argv[1:], "n:r:h" )
+  nrep = 5
+  rev  = None
+  for opt,arg in opts:
+    if   opt == "-n":
+      nrep = int(arg)
+    elif opt == "-r":
+      rev  = arg
+    elif opt == "-h":
+      print("Usage: {} [-n repetitions] [-r git_revision] [module ...]".format(sys.argv[0]))
+      sys.exit(0)
+  mods = args if len(args) > 0 else modules
+  cur  = measure( topDir, mods, nrep )
+  ref  = None
+  if None != rev:
+    with tempfile.TemporaryDirectory() as tmp:
+      arc = subprocess.run( [ "git", "archive", rev ], cwd = topDir, stdout = subprocess.PIPE, check = True )
+      subprocess.run( [ "tar", "xf", "-" ], cwd = tmp, input = arc.stdout, check = True )
+      ref = measure( tmp, mods, nrep )
+  print("{:<14s} {:>10s}".format("module", "now [s]") + ( " {:>10s} {:>8s}".format(rev[0:10], "speedup") if ref else "" ))
+  for m in mods:
+    ln = "{:<14s} {}".format( m, fmt( cur[m] ) )
+    if ref:
+      ln += " " + fmt( ref[m] )
+      if None != cur[m][0] and None != ref[m][0]:
+        ln += " {:8.1f}".format( ref[m][0]/cur[m][0] )
+    for r in [ cur[m], ref[m] if ref else (0, None) ]:
+      if None != r[1]:
+        ln += "  ({})".format( r[1] )
+        break
+    print( ln )
@@ -1,8 +1,22 @@
-from bpmMiscUtils import (pgrep, SVL, sv, plog, logSval)
+from bpmMiscUtils import (pgrep, SVL, sv, plog, logSval, diffRanges)
+import pycpsw
 import numpy as np
 
+# 'fifoStream' optionally names a stream (a Path or an object with
+# the pycpsw.Stream interface) through which the firmware delivers
+# the FIFO contents; if given then 'drain' reads from it instead of
+# the RxData register.
 class SIM():
-  def __init__(self, bay=0):
+  # Incremental coefficient downloads ('fcal', 'setPaddedIncr'): unchanged
+  # runs of up to 'incrGap' elements are written along with the changes
+  # and an array is written in one piece if more than 'incrMaxRanges'
+  # ranges or a fraction of more than 'incrMaxFrac' of its elements
+  # would have to be written.
+  incrGap       = 8
+  incrMaxRanges = 2
+  incrMaxFrac   = 0.5
+
+  def __init__(self, bay=0, fifoStream=None):
     self.bpm  = SVL(pgrep("BpmSim[[]{:d}]$".format(bay))[0])
     try:
        self.fifo = SVL(pgrep("FifoRx$")[0])
@@ -14,17 +28,75 @@ class SIM():
     self.nPO  = self.ch0.get("NumPolesOnly")
     self.nP   = self.nPO + self.nPZ
     self.pOrd = self.ch0.get("PolyOrder")
-
-  def drain(self):
+    # last values written to coefficient arrays (by path)
+    self.shadow_ = dict()
+    self.rxBuf_  = np.zeros(0, 'int16')
+    self.rxSv_   = None
+    if None == fifoStream or hasattr( fifoStream, "read" ):
+      self.fifoStrm_ = fifoStream
+    else:
+      self.fifoStrm_ = pycpsw.Stream.create( fifoStream )
+
+  # Read the FIFO contents into 'buf' (int16; if None then a buffer
+  # which is kept and reused across calls is used). 'SlotsFilled' is
+  # read once; the data are then read through the FIFO stream (if
+  # configured), as an array range (if RxData is an array) or one
+  # slot at a time. Returns a view of the filled part of the buffer.
+  def drainInto(self, buf = None):
     if not self.fifo:
       raise RuntimeError("Implementation has no FIFO")
-    return [ self.fifo.get("RxData") for i in range(0, self.fifo.get("SlotsFilled"))]
+    n = self.fifo.get("SlotsFilled")
+    if None is buf:
+      if len(self.rxBuf_) < n:
+        self.rxBuf_ = np.zeros(n, 'int16')
+      buf = self.rxBuf_
+    elif len(buf) < n:
+      raise RuntimeError("Buffer too small for {} FIFO slots".format(n))
+    if None != self.fifoStrm_:
+      with self.fifoStrm_ as f:
+        n = int( f.read( buf[0:n] )/2 )
+      return buf[0:n]
+    if None == self.rxSv_:
+      self.rxSv_ = self.fifo.elm("RxData")
+    rx = self.rxSv_
+    m  = rx.getNelms()
+    if m > 1:
+      for i in range(0, n, m):
+        k = min(m, n - i)
+        buf[i:i+k] = rx.getVal(fromIdx=0, toIdx=k-1)
+    else:
+      get = rx.getVal
+      for i in range(0, n):
+        buf[i] = get()
+    return buf[0:n]
 
-  def shot(self):
+  def drain(self):
+    return self.drainInto().copy()
+
+  # One-shot capture; the result is stored in 'buf' if given (a view
+  # is returned) -- otherwise a new array is returned.
+  def shot(self, buf = None):
     self.bpm.set("Command","OneShot")
-    y = np.array( self.drain(), 'int16' )
+    y = self.drainInto( buf )
+    if None is buf:
+      y = y.copy()
     return y
 
+  # Average of 'nshots' one-shot captures (reusing the FIFO buffer);
+  # the result is truncated to the shortest capture.
+  def shotAvg(self, nshots):
+    acc = None
+    for i in range(0, nshots):
+      self.bpm.set("Command","OneShot")
+      y = self.drainInto()
+      if None is acc:
+        acc = np.array( y, 'float64' )
+      else:
+        if len(y) < len(acc):
+          acc = acc[0:len(y)]
+        acc += y[0:len(acc)]
+    return acc/nshots
+
   def getBpm(self):
     return self.bpm
 
@@ -43,15 +115,49 @@ class SIM():
   def pc(self,ch):
     return sv("Channels[{}]/PolyCoeffs[0-{}]".format(ch,6*(self.pOrd+1)*self.nP-1),self.bpm.getPath())
 
-  def setPadded(self, sclv, vals):
+  def padded_(self, sclv, vals):
     dif = sclv.getNelms() - len(vals)
     if dif < 0:
       print("{}: [{}], length is {}".format(sclv, sclv.getNelms(), len(vals)))
       raise RuntimeError("Too many values for this ScalVal")
-    if dif > 0:
-      vals=np.concatenate( ( vals, np.zeros(dif, dtype='int32') ) )
+    p = np.zeros( sclv.getNelms(), dtype='int32' )
+    p[0:len(vals)] = vals
+    return p
+
+  def setPadded(self, sclv, vals):
+    vals = self.padded_(sclv, vals)
     sclv.setVal(vals)
     logSval(sclv, vals)
+    self.shadow_[sclv.getPath().toString()] = vals
+
+  # Write only the ranges of 'vals' (padded) which differ from what
+  # was last written to 'sclv' ('gap' defaults to 'incrGap').
+  # Returns the number of transactions.
+  def setPaddedIncr(self, sclv, vals, gap = None):
+    vals = self.padded_(sclv, vals)
+    return self.writeRanges_(sclv, vals, self.diffShadow_(sclv, vals, gap))
+
+  def diffShadow_(self, sclv, vals, gap = None):
+    if None == gap:
+      gap = self.incrGap
+    return diffRanges( self.shadow_.get( sclv.getPath().toString() ), vals, gap,
+                       self.incrMaxRanges, self.incrMaxFrac )
+
+  def writeRanges_(self, sclv, vals, rngs):
+    for (fro, to) in rngs:
+      if 0 == fro and len(vals) - 1 == to:
+        sclv.setVal(vals)
+        logSval(sclv, vals)
+      else:
+        sclv.setVal(vals[fro:to+1], fromIdx=fro, toIdx=to)
+        logSval(sclv, vals[fro:to+1], fro, to)
+    self.shadow_[sclv.getPath().toString()] = vals
+    return len(rngs)
+
+  # Forget what was written (e.g., after the firmware was reset or
+  # reconfigured by other means); the next 'fcal' writes everything.
+  def resetShadow(self):
+    self.shadow_.clear()
 
   def fca(self,fvals,pvals):
     for ch in range(0,self.nRx):
@@ -66,18 +172,36 @@ class SIM():
   def start(self):
     self.getBpm().set("Command","Run")
 
-  def fcal(self, linsim):
-    ch      = 0
+  # Download coefficients for all channels. Only index ranges which
+  # differ from the values previously written are transferred (unchanged
+  # elements separated by no more than 'gap' -- default: 'incrGap' --
+  # are included to save transactions; arrays with many or large changed
+  # ranges are written in one piece); the simulator is halted only if
+  # anything changed. With 'force' all coefficients are written.
+  #
+  # Returns the number of write transactions.
+  def fcal(self, linsim, gap = None, force = False):
+    if force:
+      self.resetShadow()
+    plan = []
+    for (ch, chan) in enumerate( linsim ):
+      if ( ch >= self.nRx ):
+        break
+      for (sclv, vals) in [ (self.fc(ch), chan.filterCoeffsDL()), (self.pc(ch), chan.polyCoeffsDL()) ]:
+        vals = self.padded_(sclv, vals)
+        rngs = self.diffShadow_(sclv, vals, gap)
+        if len(rngs) > 0:
+          plan.append( (sclv, vals, rngs) )
+    if 0 == len(plan):
+      return 0
     b       = self.getBpm()
     prevVal = b.get("Command")
     self.stop()
-    for chan in linsim:
-      if ( ch >= self.nRx ):
-        return
-      self.setPadded(self.fc(ch), chan.filterCoeffsDL())
-      self.setPadded(self.pc(ch), chan.polyCoeffsDL())
-      ch = ch + 1
+    ntr     = 0
+    for (sclv, vals, rngs) in plan:
+      ntr += self.writeRanges_(sclv, vals, rngs)
     b.set("Command",prevVal)
+    return ntr
 
 def gdaq(idx):
   d = tree.Stream._bufs[idx].copy()
@@ -0,0 +1,73 @@
+import asyncio
+import concurrent.futures
+import functools
+import threading
+import contextvars
+
+# Asyncio front-end for the (blocking) pycpsw register operations.
+#
+# Every operation is handed to a thread-pool executor and returns
+# an awaitable, e.g.,
+#
+#    v = await aget( sv( "/mmio/.../Reg", root() ) )
+#    await aset( hdl, [1,2,3], fromIdx = 0 )
+#    await aexec( cmd )
+#    await arun( s.fcal, modl )             # any blocking callable
+#
+# so that independent register I/O (and CPU-bound work such as
+# LinSim synthesis) can be overlapped with 'asyncio.gather'.
+# The pool is shared by all coroutines; 'setMaxWorkers' bounds
+# the number of concurrent blocking operations.
+
+_maxWorkers = 8
+_pool       = None
+_poolLock   = threading.Lock()
+
+def setMaxWorkers(n):
+  global _maxWorkers
+  global _pool
+  with _poolLock:
+    _maxWorkers = n
+    if None != _pool:
+      _pool.shutdown( wait = False )
+      _pool = None
+
+def getExecutor():
+  global _pool
+  with _poolLock:
+    if None == _pool:
+      _pool = concurrent.futures.ThreadPoolExecutor( max_workers = _maxWorkers )
+    return _pool
+
+def shutdown():
+  setMaxWorkers( _maxWorkers )
+
+# run the blocking callable 'fn' in the executor (in a copy of the
+# caller's context so that, e.g., bpmMiscUtils.instrPhase carries over)
+def arun(fn, *args, **kwargs):
+  loop = asyncio.get_running_loop()
+  ctx  = contextvars.copy_context()
+  return loop.run_in_executor( getExecutor(), functools.partial( ctx.run, fn, *args, **kwargs ) )
+
+# ScalVal.getVal
+def aget(hdl, *args, **kwargs):
+  return arun( hdl.getVal, *args, **kwargs )
+
+# ScalVal.setVal
+def aset(hdl, val, *args, **kwargs):
+  return arun( hdl.setVal, val, *args, **kwargs )
+
+# Command.execute
+def aexec(hdl):
+  return arun( hdl.execute )
+
+# SVL.get / SVL.set (setting also logs, like SVL.set does)
+def asvlGet(svl, name):
+  return arun( svl.get, name )
+
+def asvlSet(svl, name, val):
+  return arun( svl.set, name, val )
+
+# Run coroutine 'coro' to completion (from synchronous code)
+def runAsync(coro):
+  return asyncio.run( coro )
@@ -0,0 +1,170 @@
+import os
+import sys
+import getopt
+import numpy as np
+from   BpmStream import BpmStream
+from   loadYaml  import LoadYaml
+
+# Binary capture format for raw stream packets:
+#
+#  - fixed header ('capHdrDtype'; 64 bytes)
+#  - fixed-stride records; each record holds the packet's byte-length,
+#    a reserved word and 'slotWords' int16 words of packet data
+#    (only the first 'len' bytes are valid).
+#
+# All quantities are little-endian. The number of records is
+# derived from the file size so that an interrupted capture
+# remains readable.
+
+capMagic    = b'BPMRAWCP'
+capVersion  = 1
+
+capHdrDtype = np.dtype( [ ('magic',     'S8' ),
+                          ('version',   '<u4'),
+                          ('slotWords', '<u4'),
+                          ('recBytes',  '<u4'),
+                          ('rsvd',      '<u4', (11,)) ] )
+
+def capRecDtype(slotWords = 1500):
+  # 8-byte record header keeps the packet's 64-bit words aligned
+  return np.dtype( [ ('len',  '<u4'),
+                     ('rsvd', '<u4'),
+                     ('data', '<i2', (slotWords,)) ] )
+
+class CaptureWriter:
+  def __init__(self, fnam, slotWords = 1500, chunk = 1024):
+    self.recDtype_ = capRecDtype( slotWords )
+    self.slotW_    = slotWords
+    self.chunk_    = np.zeros( chunk, self.recDtype_ )
+    self.nrec_     = 0
+    self.f_        = open(fnam, "wb")
+    hdr = np.zeros( 1, capHdrDtype )
+    hdr['magic']     = capMagic
+    hdr['version']   = capVersion
+    hdr['slotWords'] = slotWords
+    hdr['recBytes']  = self.recDtype_.itemsize
+    hdr.tofile( self.f_ )
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+    return False
+
+  def close(self):
+    if self.f_ != None:
+      self.f_.close()
+      self.f_ = None
+
+  def getNumRecords(self):
+    return self.nrec_
+
+  # Append packets (rows of 'bufs', e.g., from BpmStream.read or
+  # BpmStreamRing.get) with their byte-lengths 'lens'.
+  def write(self, bufs, lens):
+    n = len(bufs)
+    w = min( bufs.shape[1], self.slotW_ )
+    for i in range(0, n, len(self.chunk_)):
+      m   = min( n - i, len(self.chunk_) )
+      rec = self.chunk_[0:m]
+      rec['len']            = lens[i:i+m]
+      rec['data'][:, 0:w]   = bufs[i:i+m, 0:w]
+      rec.tofile( self.f_ )
+    self.nrec_ += n
+
+  # Read 'n' packets from 'strm' (a BpmStream) straight into the
+  # record buffer (no intermediate copy) and write them out in bulk.
+  def capture(self, strm, n):
+    with strm.strm_ as f:
+      while n > 0:
+        m   = min( n, len(self.chunk_) )
+        rec = self.chunk_[0:m]
+        dat = rec['data']
+        for i in range(0, m):
+          rec['len'][i] = f.read( dat[i] )
+        rec.tofile( self.f_ )
+        self.nrec_ += m
+        n          -= m
+
+# Replay a capture file. The object implements the subset of
+# the pycpsw.Stream interface used by BpmStream:
+#
+#    with ReplayStream( "file.cap" ) as f:
+#      nbytes = f.read( buf )
+#
+# 'read' returns 0 once the end of the capture is reached (unless
+# 'loop' is set). BpmStream( ReplayStream( "file.cap" ) ) works
+# just like a hardware stream.
+#
+# Decoders may also operate directly on the memory-mapped data
+# ('getRecords()') without copying.
+class ReplayStream:
+  def __init__(self, fnam, loop = False):
+    hdr = np.fromfile( fnam, capHdrDtype, 1 )
+    if len(hdr) != 1 or hdr['magic'][0] != capMagic:
+      raise RuntimeError("{}: not a BPM capture file".format(fnam))
+    if hdr['version'][0] != capVersion:
+      raise RuntimeError("{}: unsupported capture version {}".format(fnam, hdr['version'][0]))
+    self.recDtype_ = capRecDtype( int( hdr['slotWords'][0] ) )
+    if self.recDtype_.itemsize != hdr['recBytes'][0]:
+      raise RuntimeError("{}: inconsistent record size".format(fnam))
+    # a partial last record (interrupted capture) is ignored
+    nbytes = os.path.getsize( fnam ) - capHdrDtype.itemsize
+    nrec   = nbytes // self.recDtype_.itemsize
+    if nbytes > nrec*self.recDtype_.itemsize:
+      print("{}: truncated capture -- ignoring {} bytes of an incomplete record after record {}".format(
+            fnam, nbytes - nrec*self.recDtype_.itemsize, nrec))
+    if 0 == nrec:
+      self.rec_ = np.zeros( 0, self.recDtype_ )
+    else:
+      self.rec_ = np.memmap( fnam, self.recDtype_, 'r', offset = capHdrDtype.itemsize, shape = (nrec,) )
+    self.pos_  = 0
+    self.loop_ = loop
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    return False
+
+  def __len__(self):
+    return len(self.rec_)
+
+  # (data, lens) for records [fromIdx:toIdx] -- memory-mapped views
+  def getRecords(self, fromIdx = 0, toIdx = None):
+    rec = self.rec_[fromIdx:toIdx]
+    return ( rec['data'], rec['len'] )
+
+  def rewind(self, pos = 0):
+    self.pos_ = pos
+
+  def read(self, buf, timeoutUs = -1, offset = 0):
+    if self.pos_ >= len(self.rec_):
+      if not self.loop_ or 0 == len(self.rec_):
+        return 0
+      self.pos_ = 0
+    rec        = self.rec_[self.pos_]
+    self.pos_ += 1
+    buf        = np.asarray( buf ).view( 'int16' )
+    nw         = min( int( rec['len'] + 1 ) // 2, len(buf), len(rec['data']) )
+    buf[0:nw]  = rec['data'][0:nw]
+    return min( int( rec['len'] ), 2*len(buf) )
+
+def myOpts():
+  return "o:n:"
+
+if __name__ == "__main__":
+  opts, args = getopt.getopt( sys.argv[1:], myOpts() + LoadYaml.usedOpts() )
+  fnam = "bpm.cap"
+  n    = 1000
+  for opt,arg in opts:
+    if   opt == "-o":
+      fnam = arg
+    elif opt == "-n":
+      n    = int(arg)
+  r = LoadYaml( myOpts() ).load()
+  s = BpmStream( r.findByName("BPM_A_Stream") )
+  with CaptureWriter( fnam ) as w:
+    w.capture( s, n )
+  print("Captured {} packets to {}".format(n, fnam))
@@ -3,22 +3,83 @@ import pycpsw
 import yaml_cpp
 import glob
 import math
+import re
+import threading
+import queue
+import concurrent.futures
+import contextlib
+import contextvars
+import atexit
+import time
 import pathGrep
+from   collections import OrderedDict
 import numpy    as np
-import matplotlib
 from   loadYaml import LoadYaml
 
-matplotlib.use("Qt4Agg")
-
-import matplotlib.pyplot as plt;
-
-plt.ion()
+# matplotlib is only loaded (and switched to interactive mode)
+# when plotting is requested; returns the 'pyplot' module.
+def plotInit(backend = "Qt4Agg"):
+  import matplotlib
+  if None != backend:
+    matplotlib.use( backend )
+  import matplotlib.pyplot as plt
+  plt.ion()
+  return plt
+
+# Log writer: records are collected in memory and handed (in chunks
+# of at least 'flushSize' characters) to a background thread which
+# writes them to the file. 'close' writes whatever is left; it is
+# also run at exit so that the file is complete if the script ends
+# (or raises) before 'logOff'.
+class LogWriter:
+  def __init__(self, fnam, flushSize = 1 << 20):
+    self.f_     = open(fnam,"w")
+    self.lock_  = threading.Lock()
+    self.buf_   = []
+    self.len_   = 0
+    self.fsz_   = flushSize
+    self.q_     = queue.Queue()
+    self.thr_   = threading.Thread( target = self.run_, daemon = True )
+    self.thr_.start()
+    atexit.register( self.close )
+
+  def run_(self):
+    while True:
+      chunk = self.q_.get()
+      if None == chunk:
+        return
+      self.f_.write( "".join( chunk ) )
+
+  def write(self, rec):
+    with self.lock_:
+      self.buf_.append( rec )
+      self.len_ += len( rec )
+      if self.len_ >= self.fsz_:
+        self.q_.put( self.buf_ )
+        self.buf_ = []
+        self.len_ = 0
+
+  def flush(self):
+    with self.lock_:
+      if len( self.buf_ ) > 0:
+        self.q_.put( self.buf_ )
+        self.buf_ = []
+        self.len_ = 0
+
+  def close(self):
+    atexit.unregister( self.close )
+    if self.f_.closed:
+      return
+    self.flush()
+    self.q_.put( None )
+    self.thr_.join()
+    self.f_.close()
 
 _logFile = None
 
 def logOn(fnam):
   global _logFile
-  _logFile = open(fnam,"w")
+  _logFile = LogWriter(fnam)
 
 def logOff():
   global _logFile
@@ -31,7 +92,11 @@ def logIsOn():
 
 def plog(*args):
   if None != _logFile:
-    print(*args,file=_logFile)
+    _logFile.write( " ".join( [ str(a) for a in args ] ) + "\n" )
+
+# YAML flow sequence of all values
+def logSeq_(vals):
+  return "[" + ", ".join( [ str(v) for v in np.asarray( vals ).tolist() ] ) + "]"
 
 def logSval(sv, vals, fromIdx = None, toIdx = None):
   if not logIsOn():
@@ -55,21 +120,40 @@ def logSval(sv, vals, fromIdx = None, toIdx = None):
     if 1 == len(vals):
       plog("- {}: !<value> {}".format(p, vals[0]))
     else:
-      plog("- {}:".format(p))
-      for val in vals:
-        plog("  - {}".format(val))
+      plog("- {}: {}".format(p, logSeq_(vals)))
   else:
     tail    = p.up()
     if fromIdx == toIdx:
-      plog("- {}/{}[{:d}]: !<value>{}".format(p,tail.getName(),fromIdx,val))
+      plog("- {}/{}[{:d}]: !<value> {}".format(p,tail.getName(),fromIdx,vals[0]))
     else:
-      if np.isscalar(vals):
-        plog("- {}/{}[{:d}-{:d}]: !<value>{}".format(p,tail.getName(), fromIdx, toIdx, vals))
-      else:
-        plog("- {}/{}[{:d}-{:d}]:".format(p,tail.getName(),fromIdx,toIdx))
-        for val in vals:
-          plog("  - {}".format(val))
-
+      plog("- {}/{}[{:d}-{:d}]: {}".format(p,tail.getName(),fromIdx,toIdx,logSeq_(vals)))
+
+
+# Index ranges [(from, to), ...] (inclusive) of elements in which
+# 'new' differs from 'old'. Ranges separated by no more than 'gap'
+# unchanged elements are merged. If 'old' is None (unknown) or of
+# different length then the full range is returned.
+#
+# Since every range costs a transaction the full range is also
+# returned if there would be more than 'maxRanges' ranges or if
+# they would cover more than a fraction 'maxFrac' of the elements
+# (None: no limit).
+def diffRanges(old, new, gap = 0, maxRanges = None, maxFrac = None):
+  new = np.asarray( new )
+  if None is old or len(old) != len(new):
+    if 0 == len(new):
+      return []
+    return [ (0, len(new) - 1) ]
+  idx = np.flatnonzero( np.asarray( old ) != new )
+  if 0 == len(idx):
+    return []
+  brk = np.flatnonzero( np.diff( idx ) > gap + 1 )
+  fro = np.concatenate( ( idx[0:1], idx[brk + 1] ) )
+  to  = np.concatenate( ( idx[brk],  idx[-1:]    ) )
+  if ( ( None != maxRanges and len(fro) > maxRanges ) or
+       ( None != maxFrac   and np.sum( to - fro + 1 ) > maxFrac*len(new) ) ):
+    return [ (0, len(new) - 1) ]
+  return list( zip( fro.tolist(), to.tolist() ) )
 
 def pgrep(patt):
   return pg(patt)
@@ -79,6 +163,9 @@ def root():
 
 # find leaf (matches <patt>$ or patt[...]$ )
 def pgrepl(patt):
+  if re.escape(patt) == patt:
+    # plain name; use the index' suffix lookup
+    return pg.leaf(patt)
   return pg(patt+"([[][^]]+]){0,1}$")
 
 class SVCOM(pycpsw.ScalVal):
@@ -97,25 +184,317 @@ class SVCOM(pycpsw.ScalVal):
 
   def setVal(self, val):
     self.comm_.execute()
-    plog("- {}: !<value> exec", self.comm_.getPath())
+    plog("- {}: !<value> exec".format(self.comm_.getPath()))
+
+# Register instrumentation (opt-in; see 'instrOn').
+#
+# While enabled, the handles created by 'sv' (and thus SVL, SVCOM)
+# are wrapped so that every getVal/setVal/execute is counted and
+# timed per path: number of operations, elements transferred, total
+# time and a histogram of the latencies (bucket 'b' holds operations
+# which took less than 2**b us). Operations are also accumulated per
+# phase ('instrPhase'). When disabled handles are not wrapped, i.e.,
+# there is no overhead at all.
+#
+#    instrOn()                     # before creating SVL etc.
+#    with instrPhase("fcal bay0"):
+#      s.fcal( modl )
+#    instrReport()                 # also done at exit
+class InstrStats:
+  nbuckets = 24
+
+  def __init__(self):
+    self.gets  = 0
+    self.sets  = 0
+    self.execs = 0
+    self.elms  = 0
+    self.time  = 0.0
+    self.hist  = [ 0 for i in range( self.nbuckets ) ]
+
+  def add(self, kind, nelms, dt):
+    if   kind == "g":
+      self.gets  += 1
+    elif kind == "s":
+      self.sets  += 1
+    else:
+      self.execs += 1
+    self.elms += nelms
+    self.time += dt
+    self.hist[ min( int( dt*1.0E6 ).bit_length(), self.nbuckets - 1 ) ] += 1
+
+  def getOps(self):
+    return self.gets + self.sets + self.execs
+
+  # upper bound (us) of the latency below which a fraction 'q' of the operations completed
+  def quantile(self, q):
+    lim = q*self.getOps()
+    acc = 0
+    for (b, n) in enumerate( self.hist ):
+      acc += n
+      if acc >= lim and acc > 0:
+        return 1 << b
+    return 0
+
+_instrOn     = False
+_instrLock   = threading.Lock()
+_instrPaths  = dict()
+_instrPhases = OrderedDict()   # name -> [InstrStats, wall-time]
+_instrPhase  = contextvars.ContextVar( "instrPhase", default = None )
+_instrAtExit = False
+
+def instrRecord_(path, kind, nelms, t0):
+  dt = time.perf_counter() - t0
+  ph = _instrPhase.get()
+  with _instrLock:
+    st = _instrPaths.get( path )
+    if None == st:
+      st = _instrPaths[path] = InstrStats()
+    st.add( kind, nelms, dt )
+    if None != ph:
+      _instrPhases[ph][0].add( kind, nelms, dt )
+
+def instrNelms_(vals):
+  if np.isscalar(vals) or None is vals:
+    return 1
+  return len(vals)
+
+class InstrSV_RO:
+  def __init__(self, hdl):
+    self.hdl_  = hdl
+    self.path_ = hdl.getPath().toString()
+
+  def __getattr__(self, nam):
+    return getattr( self.hdl_, nam )
+
+  def __str__(self):
+    return str( self.hdl_ )
+
+  def getVal(self, *args, **kwargs):
+    t0 = time.perf_counter()
+    v  = self.hdl_.getVal( *args, **kwargs )
+    instrRecord_( self.path_, "g", instrNelms_( v ), t0 )
+    return v
+
+class InstrSV(InstrSV_RO):
+  def setVal(self, vals, *args, **kwargs):
+    t0 = time.perf_counter()
+    v  = self.hdl_.setVal( vals, *args, **kwargs )
+    instrRecord_( self.path_, "s", instrNelms_( vals ), t0 )
+    return v
+
+class InstrCmd:
+  def __init__(self, hdl):
+    self.hdl_  = hdl
+    self.path_ = hdl.getPath().toString()
+
+  def __getattr__(self, nam):
+    return getattr( self.hdl_, nam )
+
+  def execute(self):
+    t0 = time.perf_counter()
+    self.hdl_.execute()
+    instrRecord_( self.path_, "x", 0, t0 )
+
+# Enable instrumentation; cached handles are dropped so that 'sv' creates
+# instrumented ones (objects such as SVL which hold on to handles created
+# earlier are not instrumented). With 'report' the summary is printed at exit.
+def instrOn(report = True):
+  global _instrOn
+  global _instrAtExit
+  _instrOn = True
+  _svCache.invalidate()
+  if report and not _instrAtExit:
+    atexit.register( instrReport )
+    _instrAtExit = True
+
+def instrOff():
+  global _instrOn
+  _instrOn = False
+  _svCache.invalidate()
+
+def instrIsOn():
+  return _instrOn
+
+def instrClear():
+  with _instrLock:
+    _instrPaths.clear()
+    _instrPhases.clear()
+
+@contextlib.contextmanager
+def instrPhase_(name):
+  par = _instrPhase.get()
+  if None != par:
+    name = par + "/" + name
+  with _instrLock:
+    if not name in _instrPhases:
+      _instrPhases[name] = [ InstrStats(), 0.0 ]
+  tok = _instrPhase.set( name )
+  t0  = time.perf_counter()
+  try:
+    yield name
+  finally:
+    dt = time.perf_counter() - t0
+    _instrPhase.reset( tok )
+    with _instrLock:
+      _instrPhases[name][1] += dt
+
+# Named scope (may be nested; works across threads started with
+# 'bpmAsync.arun'); a no-op unless instrumentation is on.
+def instrPhase(name):
+  if not _instrOn:
+    return contextlib.nullcontext()
+  return instrPhase_( name )
+
+# Print phases (in order of first entry) and the 'maxPaths' paths which
+# took the most time in total (all if negative).
+def instrReport(maxPaths = 40, f = None):
+  with _instrLock:
+    phases = [ (k, v[0], v[1]) for (k, v) in _instrPhases.items() ]
+    paths  = sorted( _instrPaths.items(), key = lambda kv: kv[1].time, reverse = True )
+  if 0 == len(phases) and 0 == len(paths):
+    return
+  hdr = "{:>7s} {:>7s} {:>6s} {:>9s} {:>10s} {:>8s} {:>8s}".format( "gets", "sets", "execs", "elms", "time[ms]", "p50[us]", "p99[us]" )
+  def row(st):
+    return "{:7d} {:7d} {:6d} {:9d} {:10.2f} {:8d} {:8d}".format(
+      st.gets, st.sets, st.execs, st.elms, st.time*1.0E3, st.quantile(0.5), st.quantile(0.99) )
+  if len(phases) > 0:
+    print("{:<32s} {:>10s} ".format( "Phase", "wall[ms]" ) + hdr, file = f)
+    for (k, st, wall) in phases:
+      print("{:<32s} {:10.2f} ".format( k, wall*1.0E3 ) + row( st ), file = f)
+  if maxPaths >= 0:
+    paths = paths[0:maxPaths]
+  if len(paths) > 0:
+    print("{:<60s} ".format( "Path" ) + hdr, file = f)
+    for (k, st) in paths:
+      print("{:<60s} ".format( k ) + row( st ), file = f)
+
+# Cache of ScalVal (etc.) handles created by 'sv'. Entries are keyed
+# by the path string (the string form of the starting point joined with
+# the lookup-path) so that a hit needs neither 'findByName' nor probing
+# the interfaces. Path strings don't identify the root; the cache must
+# be cleared whenever the root changes (see 'setRoot'). The kind of
+# interface that worked for a path is remembered (beyond eviction) so
+# that re-creating the handle skips the failed attempts.
+#
+# At most 'maxSize' handles are kept (LRU); 0 disables caching.
+class SVCache:
+  KIND_SV    = 1
+  KIND_SV_RO = 2
+  KIND_CMD   = 3
+  KIND_NONE  = 0
+
+  def __init__(self, maxSize = 4096):
+    self.lock_ = threading.Lock()
+    self.hdls_ = OrderedDict()
+    self.kind_ = dict()
+    self.max_  = maxSize
+    self.hits_ = 0
+    self.miss_ = 0
+
+  def setMaxSize(self, maxSize):
+    with self.lock_:
+      self.max_ = maxSize
+      self.trim_()
+
+  def trim_(self):
+    while len( self.hdls_ ) > max( self.max_, 0 ):
+      self.hdls_.popitem( last = False )
+
+  def lookup(self, key):
+    with self.lock_:
+      try:
+        h = self.hdls_[key]
+        self.hdls_.move_to_end( key )
+        self.hits_ += 1
+        return h
+      except KeyError:
+        self.miss_ += 1
+        raise
+
+  def getKind(self, key):
+    return self.kind_.get( key )
+
+  def add(self, key, kind, hdl):
+    with self.lock_:
+      self.kind_[key] = kind
+      if self.max_ > 0:
+        self.hdls_[key] = hdl
+        self.trim_()
+
+  # Drop cached handles whose path string starts with 'prefix'
+  # (all of them if 'prefix' is None)
+  def invalidate(self, prefix = None):
+    with self.lock_:
+      if None == prefix:
+        self.hdls_.clear()
+        self.kind_.clear()
+        return
+      for k in [ k for k in self.hdls_.keys() if k.startswith( prefix ) ]:
+        del self.hdls_[k]
+      for k in [ k for k in self.kind_.keys() if k.startswith( prefix ) ]:
+        del self.kind_[k]
+
+  # (hits, misses, current size, max size)
+  def info(self):
+    return ( self.hits_, self.miss_, len( self.hdls_ ), self.max_ )
+
+  def dump(self):
+    print("SV cache: {} hits, {} misses, {}/{} entries".format( *self.info() ))
+
+_svCache = SVCache()
+
+def svCache():
+  return _svCache
+
+def svCreate_(p, kind = None):
+  if SVCache.KIND_NONE == kind:
+    print( "No interface for {} -- skipping".format(p) )
+    return (kind, None)
+  if None == kind or SVCache.KIND_SV == kind:
+    try:
+      h = pycpsw.ScalVal.create(p)
+      return (SVCache.KIND_SV, InstrSV( h ) if _instrOn else h)
+    except pycpsw.InterfaceNotImplementedError:
+      pass
+  if None == kind or SVCache.KIND_SV_RO == kind:
+    try:
+      h = pycpsw.ScalVal_RO.create(p)
+      return (SVCache.KIND_SV_RO, InstrSV_RO( h ) if _instrOn else h)
+    except pycpsw.InterfaceNotImplementedError:
+      pass
+  if None == kind or SVCache.KIND_CMD == kind:
+    try:
+      comm = pycpsw.Command.create(p)
+      print("Found a command: {} -- creating fake ScalVal".format( comm.getName()) )
+      return (SVCache.KIND_CMD, SVCOM( InstrCmd( comm ) if _instrOn else comm ))
+    except pycpsw.InterfaceNotImplementedError:
+      pass
+  if None == kind:
+    print( "No interface for {} -- skipping".format(p) )
+  return (SVCache.KIND_NONE, None)
 
 def sv(p,n):
+  name = n.toString()
+  if p != None:
+    name = name + "/" + p
+  try:
+    return _svCache.lookup( name )
+  except KeyError:
+    pass
   if p != None:
     p = n.findByName(p)
   else:
     p = n
-  try:
-    return pycpsw.ScalVal.create(p)
-  except pycpsw.InterfaceNotImplementedError:
-    try:
-      return pycpsw.ScalVal_RO.create(p)
-    except pycpsw.InterfaceNotImplementedError:
-      try:
-        comm = pycpsw.Command.create(p)
-        print("Found a command: {} -- creating fake ScalVal".format( comm.getName()) )
-        return SVCOM( comm )
-      except pycpsw.InterfaceNotImplementedError:
-        print( "No interface for {} -- skipping".format(p) )
+  known     = _svCache.getKind( name )
+  if None != known and SVCache.KIND_NONE != known:
+    (kind, h) = svCreate_( p, known )
+    if None == h:
+      # remembered interface no longer works -- probe all
+      (kind, h) = svCreate_( p )
+  else:
+    (kind, h) = svCreate_( p, known )
+  _svCache.add( name, kind, h )
+  return h
 
 # expand all array elements in a path
 def pexpand(p,l=['']):
@@ -138,6 +517,29 @@ def svp(patt,n):
     l.append(sv(el,n))
   return l
 
+# Number of concurrent register reads issued by 'getVals' (and
+# thus SVL.dump, SVL.getAll, Snapshot.capture); 1 reads serially.
+readConcurrency = 8
+
+def getVal_(h):
+  try:
+    return h.getVal()
+  except Exception as e:
+    return e
+
+# Read the values of all 'handles' using a pool of (at most)
+# 'maxWorkers' threads; results are returned in the order of
+# 'handles'. A register which cannot be read yields the exception
+# (instead of a value) and does not abort the others.
+def getVals(handles, maxWorkers = None):
+  if None == maxWorkers:
+    maxWorkers = readConcurrency
+  handles = list( handles )
+  if maxWorkers <= 1 or len(handles) <= 1:
+    return [ getVal_(h) for h in handles ]
+  with concurrent.futures.ThreadPoolExecutor( max_workers = min( maxWorkers, len(handles) ) ) as pool:
+    return list( pool.map( getVal_, handles ) )
+
 def lconf(cf):
   r.findByName("mmio").loadConfigFromYamlFile(cf)
 
@@ -155,12 +557,21 @@ class SVL:
       if l > self.maxl_:
         self.maxl_ = l
 
-  def dump(self):
-    for (k,i) in self.svcont_.items():
-      v = i.getVal()
+  # read all registers (concurrently, see 'getVals'); returns a
+  # dictionary of values (or exceptions for registers which failed)
+  def getAll(self, maxWorkers = None):
+    items = [ (k, i) for (k, i) in self.svcont_.items() if None != i ]
+    vals  = getVals( [ i for (k, i) in items ], maxWorkers )
+    return dict( zip( [ k for (k, i) in items ], vals ) )
+
+  def dump(self, maxWorkers = None):
+    for (k,v) in self.getAll( maxWorkers ).items():
       if None == v:
         continue
       print( "{:{w}}: ".format( k, w=self.maxl_ ), end='' )
+      if isinstance(v, Exception):
+        print( " <error: {}>".format( v ) )
+        continue
       if isinstance(v, str):
         print( " {}".format( v ) )
         continue
@@ -219,6 +630,190 @@ def svc(path):
     svs[ch.getName()] = sv( ch.getName(), path )
   return svs
 
+# Snapshot of register values: all readable ScalVals under a hub (an
+# SVL, a Path or a path string) or a list of path strings (e.g., a
+# 'pgrep' match set). Values are held in flat arrays (numeric values
+# in one uint64 array, enum/string values in a string array, each
+# register addressed by its offset) which are saved/loaded with
+# numpy.savez/numpy.load.
+#
+#   good = Snapshot.capture( "/mmio/AppTop/AppCore/AmcBay0/Bpm" )
+#   good.save( "bpm0.npz" )
+#   ...
+#   Snapshot.load( "bpm0.npz" ).restore()
+#
+# 'restore' compares against the live values (or a last-known
+# Snapshot) and writes only registers (resp. index ranges) which
+# differ.
+class Snapshot:
+  def __init__(self):
+    self.names  = []
+    self.isStr  = np.zeros(0, bool)    # values are strings
+    self.scalar = np.zeros(0, bool)    # getVal returned a scalar
+    self.signed = np.zeros(0, bool)    # numeric values are signed
+    self.offs   = np.zeros(0, 'int64') # start in 'data' (or 'strs')
+    self.lens   = np.zeros(0, 'int64') # number of values
+    self.data   = np.zeros(0, 'uint64')
+    self.strs   = np.zeros(0, 'U1')
+    self.hdls_  = None
+
+  @staticmethod
+  def handles_(src, root_ = None):
+    if isinstance(src, (list, tuple)):
+      if None == root_:
+        root_ = root()
+      return [ (p, sv(p, root_)) for p in src ]
+    if not isinstance(src, SVL):
+      src = SVL(src)
+    base = src.getPath().toString()
+    return [ (base + "/" + k, h) for (k, h) in src.svcont_.items() ]
+
+  # registers which cannot be read are omitted
+  @staticmethod
+  def capture(src, root_ = None, maxWorkers = None):
+    hdls = [ (n, h) for (n, h) in Snapshot.handles_(src, root_) if None != h ]
+    return Snapshot.fromValues_( hdls, getVals( [ h for (n, h) in hdls ], maxWorkers ) )
+
+  # build from handles and their values; entries with a value
+  # of None (commands) or an exception are skipped
+  @staticmethod
+  def fromValues_(hdls, vals):
+    snp  = Snapshot()
+    attr = []
+    nums = []
+    strs = []
+    for ((n, h), v) in zip( hdls, vals ):
+      if None == v or isinstance(v, Exception):
+        continue
+      sc = np.isscalar(v)
+      if sc:
+        v = [ v ]
+      v  = list( v )
+      st = len(v) > 0 and isinstance(v[0], str)
+      snp.names.append( n )
+      if st:
+        attr.append( (True,  sc, False, len(strs), len(v)) )
+        strs.extend( v )
+      else:
+        attr.append( (False, sc, any( [ x < 0 for x in v ] ), len(nums), len(v)) )
+        nums.extend( [ x & 0xffffffffffffffff for x in v ] )
+    if len(attr) > 0:
+      (isStr, scal, sgnd, offs, lens) = zip( *attr )
+      snp.isStr  = np.array( isStr, bool    )
+      snp.scalar = np.array( scal,  bool    )
+      snp.signed = np.array( sgnd,  bool    )
+      snp.offs   = np.array( offs,  'int64' )
+      snp.lens   = np.array( lens,  'int64' )
+    snp.data  = np.array( nums, 'uint64' )
+    if len(strs) > 0:
+      snp.strs = np.array( strs, 'U' )
+    snp.hdls_ = dict( hdls )
+    return snp
+
+  def __len__(self):
+    return len(self.names)
+
+  # values of entry 'i' (as getVal would return them)
+  def value(self, i):
+    b = self.offs[i]
+    e = b + self.lens[i]
+    if self.isStr[i]:
+      v = self.strs[b:e].tolist()
+    elif self.signed[i]:
+      v = self.data[b:e].view('int64').tolist()
+    else:
+      v = self.data[b:e].tolist()
+    if self.scalar[i]:
+      return v[0]
+    return v
+
+  def values(self):
+    return dict( [ (n, self.value(i)) for (i, n) in enumerate( self.names ) ] )
+
+  def save(self, fnam):
+    np.savez( fnam, names = np.array( self.names, 'U' ), isStr = self.isStr, scalar = self.scalar,
+              signed = self.signed, offs = self.offs, lens = self.lens, data = self.data, strs = self.strs )
+
+  @staticmethod
+  def load(fnam):
+    snp = Snapshot()
+    with np.load( fnam ) as d:
+      snp.names  = d["names"].tolist()
+      snp.isStr  = d["isStr"]
+      snp.scalar = d["scalar"]
+      snp.signed = d["signed"]
+      snp.offs   = d["offs"]
+      snp.lens   = d["lens"]
+      snp.data   = d["data"]
+      snp.strs   = d["strs"]
+    return snp
+
+  def handle_(self, name, root_ = None):
+    if None == self.hdls_:
+      self.hdls_ = dict()
+    try:
+      return self.hdls_[name]
+    except KeyError:
+      if None == root_:
+        root_ = root()
+      h = self.hdls_[name] = sv(name, root_)
+      return h
+
+  # Write registers which differ from 'ref' (a Snapshot of the last-known
+  # state; the live values are read if None). Array registers are only
+  # written where they differ (ranges closer than 'gap' are merged) --
+  # unless the path covers several instances (e.g., a register in an
+  # array of hubs); these are written in full. Read-only registers are
+  # skipped. A register which cannot be written does not stop the
+  # restore; the failures are reported at the end (and kept in
+  # 'restoreErrors' as (name, exception) pairs). Returns the number
+  # of writes.
+  def restore(self, ref = None, gap = 0, root_ = None):
+    if None == ref:
+      ref = Snapshot.capture( self.names, root_ )
+    refIdx = dict( [ (n, i) for (i, n) in enumerate( ref.names ) ] )
+    nwr    = 0
+    self.restoreErrors = []
+    for (i, n) in enumerate( self.names ):
+      try:
+        nwr += self.restoreOne_( i, n, ref, refIdx, gap, root_ )
+      except Exception as e:
+        self.restoreErrors.append( (n, e) )
+    if len( self.restoreErrors ) > 0:
+      print("Snapshot.restore: {:d} register(s) failed:".format( len( self.restoreErrors ) ))
+      for (n, e) in self.restoreErrors:
+        print("  {}: {}".format( n, e ))
+    return nwr
+
+  def restoreOne_(self, i, n, ref, refIdx, gap, root_):
+    h = self.handle_( n, root_ )
+    if None == h or not hasattr(h, "setVal") or isinstance(h, SVCOM):
+      return 0
+    new = self.value(i)
+    old = ref.value( refIdx[n] ) if n in refIdx else None
+    if old == new:
+      return 0
+    if self.scalar[i]:
+      h.setVal( new )
+      logSval( h, new )
+      return 1
+    p    = h.getPath()
+    flat = ( p.getTailTo() - p.getTailFrom() + 1 == h.getNelms() )
+    if None == old or self.isStr[i] or len(old) != len(new) or not flat:
+      rngs = [ (0, len(new) - 1) ]
+    else:
+      rngs = diffRanges( np.array( old, object ), np.array( new, object ), gap )
+    nwr = 0
+    for (fro, to) in rngs:
+      if 0 == fro and len(new) - 1 == to:
+        h.setVal( new )
+        logSval( h, new )
+      else:
+        h.setVal( new[fro:to+1], fromIdx=fro, toIdx=to )
+        logSval( h, new[fro:to+1], fro, to )
+      nwr += 1
+    return nwr
+
 def bsadump():
   bsa = pg("BsaWaveformEngine")
 
@@ -240,13 +835,20 @@ def readStream(p):
     n = f.read(b)
   return (b, n)
 
-def bpmMiscUtilsInit(otherOpts=""):
+# Switch to a new root; handles cached by 'sv' refer to the old one
+def setRoot(root, cacheKey = None):
   global r
   global pg
-  r  = LoadYaml(otherOpts).load()
-  pg = pathGrep.PathGrep( r )
+  r  = root
+  pg = pathGrep.PathGrep( root, cacheKey = cacheKey )
+  _svCache.invalidate()
+
+def bpmMiscUtilsInit(otherOpts=""):
+  ly = LoadYaml(otherOpts)
+  setRoot( ly.load(), ly.cacheKey() )
 
 if __name__ == "__main__":
+  plt = plotInit()
   bpmMiscUtilsInit()
   daq=[ SVL( p ) for p in pg( "DaqMuxV2[^/]*$")              ]
   bsa=[ SVL( p ) for p in pg( "WaveformEngineBuffers[^/]*$") ]
@@ -1,66 +1,70 @@
-from   bpmMiscUtils import bpmMiscUtilsInit, sv, pgrep, root, logOn, logOff, SVL
+from   bpmMiscUtils import bpmMiscUtilsInit, sv, pgrep, root, logOn, logOff, SVL, instrOn, instrPhase
 import bpm
 import LinSim
 import sys
 import getopt
+import asyncio
+from   bpmAsync import arun, aget, asvlSet
 from   loadYaml import LoadYaml
 
+# -C / -S: force cavity / stripline mode (default: ask the firmware)
+# -j <n> : use <n> worker processes for LinSim synthesis (0: all CPUs)
+# -I     : instrument register access (report printed at exit)
+# -m <f> : keep the synthesized models in <f> (.npz; loaded if it exists,
+#          updated at exit)
+# -R <n> : seed of the toleranced channels (default: 1; bay <b> uses <n>+<b>)
 def myOpts():
-  return "CS"
-
-opts, args = getopt.getopt( sys.argv[1:], myOpts() + LoadYaml.usedOpts() )
-
-patt    = "Kcu*Bpm*/000TopLevel.yaml"
-
-if len(args) > 0:
-  patt = args[0]
+  return "CSj:Im:R:"
 
+# set by the command-line options (see 'main')
 hasMode = False
+modeCav = None
+workers = None
+seed    = 1
 
-for opt,arg in opts:
-  if   opt == "-C":
-    modeCav = True
-    hasMode = True
-  elif opt == "-S":
-    modeCav = False
-    hasMode = True
-
-bpmMiscUtilsInit(myOpts())
+# U: Fo 30    , Bw: 1.25
+# V: Fo 38    , Bw: 2
+# R: Fo 37    , Bw: 3
+#
+# Channels are mapped to spare, V, U, Ref
+fs   = 370.
+Fcav = [0, 38.2/fs , 30.3/fs  , 37.2/fs ]
+Qcav = [0, 38.2/2.1, 30.3/1.25, 37.2/3.3]
+#Fcav = [0, 38.2/fs , 36.7/fs  , 37.3/fs ]
+#Qcav = [0, 38.2/2.2, 36.7/1.25, 37.3/3.1]
+Ffil = (49.2+22.3)/2/fs 
+Bfil = (49.2-22.3)/fs 
 
-logOn("logf.yaml")
+# A fixed seed makes the models reproducible (and thus cacheable, see '-m').
+def synth(modeCav, bay):
+  if modeCav:
+    return LinSim.mkCavitySystem( Fcav, Qcav, Ffil, Bfil, seed = seed + bay, workers = workers )
+  else:
+    return LinSim.mkStriplineSystem( Ffil, Bfil, seed = seed + bay, workers = workers )
 
-# silence the Fan
-sv( pgrep(".*FanController/Bypass")[0], root() ).setVal( 0 )
+async def mkSim(bay):
+  s = await arun( bpm.SIM, bay )
+  await asvlSet( s.getBpm(), "Command", "Halt" )
+  return s
 
-for bay in [0,1]:
+# The bays are initialized concurrently: while one bay's model
+# is synthesized the other bay's registers may be written.
+async def initBay(bay):
 
-  if not hasMode:
-    fwMode = sv( pgrep(".*AmcBay{:d}/Bpm/FirmwareConfiguration".format(bay))[0], root() ).getVal()
-    print("FW Mode: ", fwMode)
-    modeCav = (fwMode != "StriplineBpm")
-  
-  print("Cavity Mode: ", modeCav)
+  with instrPhase("mode bay{:d}".format(bay)):
+    if hasMode:
+      cav = modeCav
+    else:
+      fwMode = await aget( sv( pgrep(".*AmcBay{:d}/Bpm/FirmwareConfiguration".format(bay))[0], root() ) )
+      print("Bay {:d} FW Mode: ".format(bay), fwMode)
+      cav = (fwMode != "StriplineBpm")
   
+  print("Bay {:d} Cavity Mode: ".format(bay), cav)
   
-  s = bpm.SIM( bay )
-  s.getBpm().set("Command", "Halt")
-  # U: Fo 30    , Bw: 1.25
-  # V: Fo 38    , Bw: 2
-  # R: Fo 37    , Bw: 3
-  #
-  # Channels are mapped to spare, V, U, Ref
-  fs   = 370.
-  Fcav = [0, 38.2/fs , 30.3/fs  , 37.2/fs ]
-  Qcav = [0, 38.2/2.1, 30.3/1.25, 37.2/3.3]
-  #Fcav = [0, 38.2/fs , 36.7/fs  , 37.3/fs ]
-  #Qcav = [0, 38.2/2.2, 36.7/1.25, 37.3/3.1]
-  Ffil = (49.2+22.3)/2/fs 
-  Bfil = (49.2-22.3)/fs 
-  if modeCav:
-    modl = LinSim.mkCavitySystem( Fcav, Qcav, Ffil, Bfil )
-  else:
-    modl = LinSim.mkStriplineSystem( Ffil, Bfil )
-  s.fcal( modl )
+  with instrPhase("setup bay{:d}".format(bay)):
+    (s, modl) = await asyncio.gather( mkSim( bay ), arun( synth, cav, bay ) )
+  with instrPhase("fcal bay{:d}".format(bay)):
+    await arun( s.fcal, modl )
   # Full beam rate is timing-clk/200 (= 1300/7/200)
   # If the JESD clock runs at 370MHz then
   # one beam cycle takes 370 * 1400/1300 = 398.46153846153845
@@ -86,41 +90,97 @@ for bay in [0,1]:
   #      
   #      We choose an arbitrary value of 320 -- the filter
   #      response should have rung out by this time.
-  s.getBpm().set("PeriodInt",   320)
-  s.getBpm().set("PeriodFract", 60495)
-  s.getBpm().set("Command", "Run")
-
-try:
-  evrp = pgrep("EvrV2$")[0]
-except IndexError:
-  evrp = pgrep("EvrV2CoreTriggers$")[0]
-
-evrChnl  = SVL( evrp + "/EvrV2ChannelReg[0-1]"  )
-evrTrigS = SVL( evrp + "/EvrV2TriggerReg[0-1]"  )
-evrTrigF = SVL( evrp + "/EvrV2TriggerReg[4-5]"  )
-msgTrig  = SVL( evrp + "/EvrV2TriggerReg[11-12]")
-
-evrChnl.set("DestSel", 0x20000)
-evrChnl.set("Enable",       1)
-evrChnl.set("RateSel",   [0,6])
-evrTrigF.set("Source",   [0,0])
-evrTrigF.set("Enable",   [1,1])
-evrTrigF.set("Width",    [1,1])
-evrTrigS.set("Source",   [1,1])
-evrTrigS.set("Enable",   [1,1])
-evrTrigS.set("Width",    [1,1])
-msgTrig.set("Source",   [0,1])
-# decimator trigger #12 must be active
-# one clock after posting trigger #11
-#
-# If backplane message decimation is enabled
-# then backplane messages are only posted
-# if trigger #12 is asserted (for debugging; software
-# may receive and look at messages without being
-# swamped) 
-msgTrig.set("Width",   [1,2])
-msgTrig.set("Enable",       1)
-msgTrig.set("Delay",     180)
-print("Initialization DONE")
-
-logOff()
+  with instrPhase("run bay{:d}".format(bay)):
+    await asvlSet( s.getBpm(), "PeriodInt",   320 )
+    await asvlSet( s.getBpm(), "PeriodFract", 60495 )
+    await asvlSet( s.getBpm(), "Command", "Run" )
+
+# EVR setup is independent of the simulators and runs alongside
+# the bays (the individual settings are applied in order).
+def initEvr():
+  try:
+    evrp = pgrep("EvrV2$")[0]
+  except IndexError:
+    evrp = pgrep("EvrV2CoreTriggers$")[0]
+  
+  evrChnl  = SVL( evrp + "/EvrV2ChannelReg[0-1]"  )
+  evrTrigS = SVL( evrp + "/EvrV2TriggerReg[0-1]"  )
+  evrTrigF = SVL( evrp + "/EvrV2TriggerReg[4-5]"  )
+  msgTrig  = SVL( evrp + "/EvrV2TriggerReg[11-12]")
+  
+  evrChnl.set("DestSel", 0x20000)
+  evrChnl.set("Enable",       1)
+  evrChnl.set("RateSel",   [0,6])
+  evrTrigF.set("Source",   [0,0])
+  evrTrigF.set("Enable",   [1,1])
+  evrTrigF.set("Width",    [1,1])
+  evrTrigS.set("Source",   [1,1])
+  evrTrigS.set("Enable",   [1,1])
+  evrTrigS.set("Width",    [1,1])
+  msgTrig.set("Source",   [0,1])
+  # decimator trigger #12 must be active
+  # one clock after posting trigger #11
+  #
+  # If backplane message decimation is enabled
+  # then backplane messages are only posted
+  # if trigger #12 is asserted (for debugging; software
+  # may receive and look at messages without being
+  # swamped) 
+  msgTrig.set("Width",   [1,2])
+  msgTrig.set("Enable",       1)
+  msgTrig.set("Delay",     180)
+
+async def evrSetup():
+  with instrPhase("EVR setup"):
+    await arun( initEvr )
+
+async def initAll():
+  await asyncio.gather( initBay( 0 ), initBay( 1 ), evrSetup() )
+
+# The script's work is done here only (not on import) -- the worker
+# processes of the LinSim synthesis ('-j') import this module, too.
+def main():
+  global hasMode
+  global modeCav
+  global workers
+  global seed
+
+  opts, args = getopt.getopt( sys.argv[1:], myOpts() + LoadYaml.usedOpts() )
+
+  patt    = "Kcu*Bpm*/000TopLevel.yaml"
+
+  if len(args) > 0:
+    patt = args[0]
+
+  for opt,arg in opts:
+    if   opt == "-C":
+      modeCav = True
+      hasMode = True
+    elif opt == "-S":
+      modeCav = False
+      hasMode = True
+    elif opt == "-j":
+      workers = int(arg)
+    elif opt == "-I":
+      instrOn()
+    elif opt == "-m":
+      LinSim.linSysCache().attach( arg )
+    elif opt == "-R":
+      seed = int(arg)
+
+  bpmMiscUtilsInit(myOpts())
+
+  logOn("logf.yaml")
+
+  # silence the Fan
+  with instrPhase("fan"):
+    sv( pgrep(".*FanController/Bypass")[0], root() ).setVal( 0 )
+
+  asyncio.run( initAll() )
+
+  print("Initialization DONE")
+
+  logOff()
+
+if __name__ == "__main__":
+  main()
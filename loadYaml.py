@@ -1,6 +1,9 @@
 import glob
 import pycpsw
 import sys
+import os
+import re
+import hashlib
 from   getopt import getopt
 
 def usage(nm):
@@ -28,6 +31,7 @@ class LoadYaml():
     self.globPatt  = globPatt
     self.rootName  = rootName
     self.ipAddr    = ipAddr
+    self.yamlFile  = None
 
   def allOpts(self):
     return self.usedOpts() + self.otherOpts
@@ -52,4 +56,38 @@ class LoadYaml():
       fixIp = IpFixup( self.ipAddr )
     else:
       fixIp = None
-    return pycpsw.Path.loadYamlFile(glob.glob(self.globPatt)[0], self.rootName, yamlFixup=fixIp)
+    self.yamlFile = glob.glob(self.globPatt)[0]
+    return pycpsw.Path.loadYamlFile(self.yamlFile, self.rootName, yamlFixup=fixIp)
+
+  # Key identifying the hierarchy that was loaded (hash of the contents
+  # of the YAML file and of all files it '#include's -- recursively --
+  # and the root name); None if nothing was loaded yet.
+  def cacheKey(self):
+    if None == self.yamlFile:
+      return None
+    h = hashlib.sha1()
+    hashYaml_( h, self.yamlFile, os.path.dirname( self.yamlFile ), set() )
+    h.update( self.rootName.encode() )
+    return h.hexdigest()
+
+_includeRe = re.compile(rb"^#include\s+(\S+)")
+
+# Feed the contents of 'fnam' and of the files it includes (relative
+# to 'incDirName') into the hash 'h'; every file is hashed once.
+def hashYaml_(h, fnam, incDirName, seen):
+  fnam = os.path.normpath( fnam )
+  if fnam in seen:
+    return
+  seen.add( fnam )
+  try:
+    with open(fnam, "rb") as f:
+      txt = f.read()
+  except OSError:
+    # CPSW will complain; the key just reflects that it is missing
+    h.update( b'<missing>\0' )
+    return
+  h.update( txt )
+  for l in txt.splitlines():
+    m = _includeRe.match( l )
+    if None != m:
+      hashYaml_( h, os.path.join( incDirName, m.group(1).decode() ), incDirName, seen )
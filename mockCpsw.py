@@ -0,0 +1,832 @@
+#!/usr/bin/python3
+
+# In-process stand-in for 'pycpsw' (the subset used by these scripts)
+# so that they can be exercised, benchmarked and regression-tested
+# without hardware.
+#
+# A hierarchy is either loaded from the firmware's YAML description
+# (Path.loadYamlFile; '#include' / '#once' are honored, PyYAML is
+# required) or built programmatically:
+#
+#    top = MockHub("NetIODev")
+#    sim = top.hub("mmio").hub("BpmSim", nelms = 2)
+#    sim.field("NumRx", init = 4)
+#    sim.field("Command", enums = [ ("Halt", 0), ("Run", 1) ])
+#    sim.hub("Channels", nelms = 4).field("FilterCoeffs", nelms = 64, sizeBits = 18, isSigned = True)
+#    root = Path.create( top )
+#
+# Register values are held in numpy arrays (one per register instance,
+# created on first access). Every transaction (getVal/setVal/execute/
+# stream read) may be delayed by a configurable latency (setLatency)
+# and is counted (getStats/resetStats).
+#
+# Use 'install()' before importing any module that imports pycpsw:
+#
+#    import mockCpsw
+#    mockCpsw.install()
+#    import bpmMiscUtils
+#
+# or run a script against the mock:
+#
+#    python3 mockCpsw.py [-l latency_us] [-c config.yaml] [-e] [-s] bpmSimInit.py -Y 000TopLevel.yaml
+#
+# ('-c' loads a configuration file, e.g., the firmware's 'defaults.yaml',
+# into the hierarchy right after it is loaded; '-e' sets 'exploreElements';
+# '-s' prints the transaction counts at exit).
+
+import os
+import re
+import sys
+import time
+import types
+import getopt
+import runpy
+import atexit
+import threading
+import itertools
+import numpy as np
+
+class CPSWError(Exception):
+  pass
+
+class InterfaceNotImplementedError(CPSWError):
+  pass
+
+class NotFoundError(CPSWError):
+  pass
+
+class InvalidArgError(CPSWError):
+  pass
+
+class InvalidPathError(CPSWError):
+  pass
+
+class ConfigurationError(CPSWError):
+  pass
+
+class TimeoutError(CPSWError):
+  pass
+
+# Transaction accounting / latency
+
+class MockStats:
+  def __init__(self):
+    self.lock_ = threading.Lock()
+    self.reset()
+
+  def reset(self):
+    self.reads       = 0
+    self.writes      = 0
+    self.executes    = 0
+    self.streamReads = 0
+    self.elmsRead    = 0
+    self.elmsWritten = 0
+
+  def count(self, kind, nelms = 0):
+    with self.lock_:
+      if   kind == "r":
+        self.reads       += 1
+        self.elmsRead    += nelms
+      elif kind == "w":
+        self.writes      += 1
+        self.elmsWritten += nelms
+      elif kind == "x":
+        self.executes    += 1
+      elif kind == "s":
+        self.streamReads += 1
+
+  def get(self):
+    with self.lock_:
+      return { "reads"       : self.reads,
+               "writes"      : self.writes,
+               "executes"    : self.executes,
+               "streamReads" : self.streamReads,
+               "elmsRead"    : self.elmsRead,
+               "elmsWritten" : self.elmsWritten }
+
+_stats   = MockStats()
+_latency = 0.0
+_lock    = threading.Lock()
+
+# per-transaction latency (seconds)
+def setLatency(sec):
+  global _latency
+  _latency = sec
+
+def getLatency():
+  return _latency
+
+def getStats():
+  return _stats.get()
+
+def resetStats():
+  _stats.reset()
+
+def transaction_(kind, nelms = 0):
+  _stats.count( kind, nelms )
+  if _latency > 0.0:
+    time.sleep( _latency )
+
+# Hierarchy (the entries double as the 'Child' interface)
+
+class MockEntry:
+  def __init__(self, name, nelms = 1, desc = ""):
+    self.name_  = name
+    self.nelms_ = nelms
+    self.desc_  = desc
+
+  def getName(self):
+    return self.name_
+
+  def getDescription(self):
+    return self.desc_
+
+  def getNelms(self):
+    return self.nelms_
+
+  def isHub(self):
+    return None
+
+class MockHub(MockEntry):
+  def __init__(self, name, nelms = 1, desc = ""):
+    MockEntry.__init__(self, name, nelms, desc)
+    self.children_ = dict()
+
+  def isHub(self):
+    return self
+
+  def getChildren(self):
+    return list( self.children_.values() )
+
+  def getChild(self, name):
+    return self.children_.get( name )
+
+  def add(self, entry):
+    if entry.getName() in self.children_:
+      raise ConfigurationError("{}: duplicate child '{}'".format( self.name_, entry.getName() ))
+    self.children_[entry.getName()] = entry
+    return entry
+
+  def hub(self, name, nelms = 1, desc = ""):
+    return self.add( MockHub( name, nelms, desc ) )
+
+  def field(self, name, nelms = 1, **kwargs):
+    return self.add( MockField( name, nelms, **kwargs ) )
+
+  def command(self, name, nelms = 1, **kwargs):
+    return self.add( MockCommand( name, nelms, **kwargs ) )
+
+  def stream(self, name, **kwargs):
+    return self.add( MockStream( name, **kwargs ) )
+
+# Integer register. 'mode' is "RW", "RO" or "WO"; 'enums' a list of
+# (name, value) pairs; 'init' the initial value(s) of every instance.
+#
+# 'onRead(field, key, vals)' / 'onWrite(field, key, vals)' may be set
+# to emulate firmware behavior; they are called (without the latency)
+# with the instance key (tuple of the array indices leading to the
+# register) and the instance's value array before a read / after a
+# write, respectively.
+class MockField(MockEntry):
+  def __init__(self, name, nelms = 1, sizeBits = 32, isSigned = False, mode = "RW",
+               enums = None, init = 0, desc = "", onRead = None, onWrite = None):
+    MockEntry.__init__(self, name, nelms, desc)
+    self.sizeBits_ = sizeBits
+    self.isSigned_ = isSigned
+    self.mode_     = mode
+    self.enums_    = None
+    self.enumVals_ = None
+    if None != enums and len(enums) > 0:
+      self.enums_    = dict( [ (n, v) for (n, v) in enums ] )
+      self.enumVals_ = dict( [ (v, n) for (n, v) in enums ] )
+    self.init_     = init
+    self.onRead    = onRead
+    self.onWrite   = onWrite
+    self.dtype_    = 'uint64' if ( sizeBits >= 64 and not isSigned ) else 'int64'
+    self.vals_     = dict()
+
+  def getSizeBits(self):
+    return self.sizeBits_
+
+  def isSigned(self):
+    return self.isSigned_
+
+  def getMode(self):
+    return self.mode_
+
+  # value array of the instance 'key' (created on first access)
+  def instance(self, key = ()):
+    try:
+      return self.vals_[key]
+    except KeyError:
+      v = np.zeros( self.nelms_, self.dtype_ )
+      v[:] = self.wrap( self.numeric( self.init_ ) )
+      self.vals_[key] = v
+      return v
+
+  def reset(self):
+    self.vals_.clear()
+
+  def numeric(self, vals):
+    if None == self.enums_:
+      return vals
+    try:
+      if isinstance(vals, str):
+        return self.enums_[vals]
+      if not np.isscalar(vals):
+        return [ self.enums_[v] if isinstance(v, str) else v for v in vals ]
+    except KeyError as e:
+      raise InvalidArgError("{}: no enum '{}'".format( self.name_, e.args[0] ))
+    return vals
+
+  # wrap to 'sizeBits' (sign-extend if signed)
+  def wrap(self, vals):
+    a = np.asarray( vals )
+    if a.dtype.kind not in "iu":
+      if a.dtype.kind == "f":
+        a = np.round( a )
+      a = a.astype( 'int64' )
+    if self.sizeBits_ >= 64:
+      return a.astype( self.dtype_ )
+    m = ( 1 << self.sizeBits_ ) - 1
+    a = a.astype( 'int64' ) & m
+    if self.isSigned_:
+      h = 1 << ( self.sizeBits_ - 1 )
+      a = ( ( a + h ) & m ) - h
+    return a
+
+  def toUser(self, vals, forceNumeric = False):
+    l = vals.tolist()
+    if None != self.enumVals_ and not forceNumeric:
+      l = [ self.enumVals_.get( v, v ) for v in l ]
+    return l
+
+# Command; 'sequence' is a list of (entry, value) pairs (paths relative
+# to the command's parent, as in a YAML 'SequenceCommand'; the entry
+# "usleep" delays by 'value' microseconds). 'fn(path)' (if given) is
+# called in addition.
+class MockCommand(MockEntry):
+  def __init__(self, name, nelms = 1, sequence = None, fn = None, desc = ""):
+    MockEntry.__init__(self, name, nelms, desc)
+    self.seq_ = sequence if None != sequence else []
+    self.fn_  = fn
+
+# Stream; frames are queued with 'push' or produced on demand by
+# 'source()' (returning bytes/ndarray, or None if nothing is available).
+class MockStream(MockEntry):
+  def __init__(self, name, source = None, desc = ""):
+    MockEntry.__init__(self, name, 1, desc)
+    self.source_ = source
+    self.frames_ = []
+    self.cond_   = threading.Condition()
+
+  def setSource(self, source):
+    self.source_ = source
+
+  def push(self, frame):
+    with self.cond_:
+      self.frames_.append( frame )
+      self.cond_.notify()
+
+  def pop_(self, timeoutUs):
+    with self.cond_:
+      if 0 == len(self.frames_) and None != self.source_:
+        f = self.source_()
+        if not f is None:
+          return f
+      if 0 == len(self.frames_):
+        if timeoutUs >= 0:
+          self.cond_.wait( timeoutUs/1.0E6 )
+        else:
+          self.cond_.wait_for( lambda: len(self.frames_) > 0 )
+      if 0 == len(self.frames_):
+        return None
+      return self.frames_.pop(0)
+
+# Paths
+
+class PathVisitor:
+  def __init__(self):
+    pass
+
+  def visitPre(self, path):
+    return True
+
+  def visitPost(self, path):
+    pass
+
+class YamlFixup:
+  def __init__(self):
+    pass
+
+  def __call__(self, node, top):
+    pass
+
+# minimal yaml-cpp style node (as seen by a YamlFixup)
+class YamlNode_:
+  def __init__(self, parent, key):
+    self.parent_ = parent
+    self.key_    = key
+
+  def get_(self):
+    return self.parent_.get( self.key_ )
+
+  def __getitem__(self, key):
+    v = self.get_()
+    if not isinstance(v, dict):
+      v = dict()
+    return YamlNode_( v, key )
+
+  def IsDefined(self):
+    return self.key_ in self.parent_
+
+  def IsNull(self):
+    return None == self.get_()
+
+  def set(self, val):
+    self.parent_[self.key_] = val
+
+  def getAs(self):
+    return self.get_()
+
+# If set then 'explore' visits every element of an array of hubs
+# individually (e.g., .../BpmSim[0]/..., .../BpmSim[1]/...) instead
+# of the entire range (.../BpmSim[0-1]/...).
+exploreElements = False
+
+_elmPatt = re.compile(r"^([^\[\]]+)(\[([0-9]+)(-([0-9]+))?\])?$")
+
+class Path:
+  def __init__(self, origin, elms = None):
+    self.origin_ = origin
+    self.elms_   = list(elms) if None != elms else []  # (entry, from, to)
+
+  @staticmethod
+  def create(hub):
+    if isinstance(hub, Path):
+      return hub.clone()
+    return Path( hub )
+
+  @staticmethod
+  def loadYamlFile(fnam, rootName = "root", incDirName = None, yamlFixup = None):
+    p = Path( hubFromYamlFile( fnam, rootName, incDirName, yamlFixup ) )
+    for cf in _initConfigs:
+      p.loadConfigFromYamlFile( cf )
+    return p
+
+  def clone(self):
+    return Path( self.origin_, self.elms_ )
+
+  def origin(self):
+    return self.origin_
+
+  def empty(self):
+    return 0 == len(self.elms_)
+
+  def size(self):
+    return len(self.elms_)
+
+  def tail(self):
+    if self.empty():
+      return self.origin_
+    return self.elms_[-1][0]
+
+  def getTailFrom(self):
+    if self.empty():
+      return 0
+    return self.elms_[-1][1]
+
+  def getTailTo(self):
+    if self.empty():
+      return 0
+    return self.elms_[-1][2]
+
+  # strip the tail (in place) and return it
+  def up(self):
+    if self.empty():
+      raise InvalidPathError("cannot go up from the root")
+    return self.elms_.pop()[0]
+
+  def getNelms(self):
+    n = 1
+    for (e, f, t) in self.elms_:
+      n *= t - f + 1
+    return n
+
+  def toString(self):
+    s = ""
+    for (e, f, t) in self.elms_:
+      s += "/" + e.getName()
+      if e.getNelms() > 1:
+        if f == t:
+          s += "[{:d}]".format(f)
+        else:
+          s += "[{:d}-{:d}]".format(f, t)
+    if "" == s:
+      return "/"
+    return s
+
+  def __str__(self):
+    return self.toString()
+
+  def __repr__(self):
+    return "<mockCpsw.Path {}>".format( self.toString() )
+
+  def append_(self, entry, fro = None, to = None):
+    if None == fro:
+      fro = 0
+      to  = entry.getNelms() - 1
+    elif None == to:
+      to  = fro
+    if fro < 0 or to < fro or to >= entry.getNelms():
+      raise InvalidArgError("{}: index range [{}-{}] out of bounds".format( entry.getName(), fro, to ))
+    self.elms_.append( (entry, fro, to) )
+
+  def findByName(self, name):
+    if name.startswith("/"):
+      p = Path( self.origin_ )
+    else:
+      p = self.clone()
+    for comp in name.split("/"):
+      if "" == comp or "." == comp:
+        continue
+      if ".." == comp:
+        p.up()
+        continue
+      m = _elmPatt.match( comp )
+      if None == m:
+        raise InvalidPathError("invalid path element '{}'".format( comp ))
+      hub = p.tail().isHub()
+      ent = hub.getChild( m.group(1) ) if None != hub else None
+      if None == ent:
+        raise NotFoundError("{}: no child '{}'".format( p.toString(), m.group(1) ))
+      fro = int( m.group(3) ) if None != m.group(3) else None
+      to  = int( m.group(5) ) if None != m.group(5) else None
+      p.append_( ent, fro, to )
+    return p
+
+  def explore(self, visitor):
+    self.explore_( self.clone(), visitor )
+
+  @staticmethod
+  def explore_(p, visitor):
+    if visitor.visitPre( p ):
+      hub = p.tail().isHub()
+      if None != hub:
+        for c in hub.getChildren():
+          if exploreElements and None != c.isHub():
+            rngs = [ (i, i) for i in range( c.getNelms() ) ]
+          else:
+            rngs = [ (None, None) ]
+          for (fro, to) in rngs:
+            q = p.clone()
+            q.append_( c, fro, to )
+            Path.explore_( q, visitor )
+    visitor.visitPost( p )
+
+  # Apply a configuration file; the top-level key names this path's tail,
+  # below that the keys are child names (optionally with index ranges)
+  # and the leaves are values. Sequences of mappings are applied in order
+  # (this covers the register-write logs of bpmMiscUtils.logOn, too).
+  def loadConfigFromYamlFile(self, fnam, incDirName = None):
+    import yaml
+    with open( fnam ) as f:
+      cfg = yaml.load( f, Loader = configLoader() )
+    if isinstance(cfg, dict) and self.tail().getName() in cfg:
+      cfg = cfg[self.tail().getName()]
+    return self.loadConfig_( cfg )
+
+  def loadConfig_(self, node):
+    n = 0
+    if isinstance(node, list) and all( [ isinstance(i, dict) for i in node ] ):
+      for i in node:
+        n += self.loadConfig_( i )
+    elif isinstance(node, dict):
+      for (k, v) in node.items():
+        try:
+          p = self.findByName( k )
+        except CPSWError as e:
+          print("mockCpsw: config {}/{}: {}".format( self.toString(), k, e ))
+          continue
+        n += p.loadConfig_( v )
+    elif None != node:
+      try:
+        ScalVal.create( self ).setVal( node )
+        n += 1
+      except CPSWError as e:
+        print("mockCpsw: config {}: {}".format( self.toString(), e ))
+    return n
+
+# Interfaces
+
+class Entry_:
+  def __init__(self, path = None):
+    if None != path:
+      self.path_ = path.clone()
+      self.ent_  = path.tail()
+
+  def getName(self):
+    return self.ent_.getName()
+
+  def getDescription(self):
+    return self.ent_.getDescription()
+
+  def getPath(self):
+    return self.path_.clone()
+
+  def getNelms(self):
+    return self.path_.getNelms()
+
+class Val_(Entry_):
+  def __init__(self, path = None):
+    Entry_.__init__(self, path)
+    if None != path:
+      # instance keys: all combinations of indices above the leaf
+      self.keys_ = list( itertools.product( *[ range(f, t + 1) for (e, f, t) in self.path_.elms_[0:-1] ] ) )
+      self.from_ = self.path_.getTailFrom()
+      self.to_   = self.path_.getTailTo()
+
+  @staticmethod
+  def field_(path, cls, modes):
+    e = path.tail()
+    if not isinstance(e, MockField) or not e.getMode() in modes:
+      raise InterfaceNotImplementedError("{}: {} not supported".format( path.toString(), cls ))
+    return e
+
+  def getSizeBits(self):
+    return self.ent_.getSizeBits()
+
+  def isSigned(self):
+    return self.ent_.isSigned()
+
+  def range_(self, fromIdx, toIdx):
+    if fromIdx < 0:
+      return ( self.from_, self.to_ )
+    f = self.from_ + fromIdx
+    t = self.from_ + ( toIdx if toIdx >= 0 else fromIdx )
+    if t < f or t > self.to_:
+      raise InvalidArgError("{}: index range [{}-{}] out of bounds".format( self.path_.toString(), fromIdx, toIdx ))
+    return ( f, t )
+
+class ScalVal_RO(Val_):
+  @staticmethod
+  def create(path):
+    ScalVal_RO.field_( path, "ScalVal_RO", ("RO", "RW") )
+    return ScalVal_RO( path )
+
+  def getVal(self, fromIdx = -1, toIdx = -1, forceNumeric = False):
+    (f, t) = self.range_( fromIdx, toIdx )
+    e      = self.ent_
+    vals   = []
+    with _lock:
+      for k in self.keys_:
+        v = e.instance( k )
+        if None != e.onRead:
+          e.onRead( e, k, v )
+        vals.extend( e.toUser( v[f:t+1], forceNumeric ) )
+    transaction_( "r", len(vals) )
+    if 1 == len(vals):
+      return vals[0]
+    return vals
+
+class ScalVal(ScalVal_RO):
+  @staticmethod
+  def create(path):
+    ScalVal.field_( path, "ScalVal", ("RW",) )
+    return ScalVal( path )
+
+  # scalars are written to all elements
+  def setVal(self, vals, fromIdx = -1, toIdx = -1):
+    (f, t) = self.range_( fromIdx, toIdx )
+    e      = self.ent_
+    n      = t - f + 1
+    tot    = n * len(self.keys_)
+    vals   = e.numeric( vals )
+    if np.isscalar(vals):
+      a = np.full( tot, e.wrap( vals ), e.dtype_ )
+    else:
+      a = e.wrap( np.asarray( vals ).ravel() )
+      if len(a) != tot:
+        raise InvalidArgError("{}: {} values for {} elements".format( self.path_.toString(), len(a), tot ))
+    with _lock:
+      for (i, k) in enumerate( self.keys_ ):
+        v = e.instance( k )
+        v[f:t+1] = a[i*n:(i+1)*n]
+        if None != e.onWrite:
+          e.onWrite( e, k, v )
+    transaction_( "w", tot )
+    return tot
+
+class ScalVal_WO(Val_):
+  @staticmethod
+  def create(path):
+    ScalVal_WO.field_( path, "ScalVal_WO", ("WO", "RW") )
+    return ScalVal_WO( path )
+
+  setVal = ScalVal.setVal
+
+class Command(Entry_):
+  @staticmethod
+  def create(path):
+    if not isinstance( path.tail(), MockCommand ):
+      raise InterfaceNotImplementedError("{}: Command not supported".format( path.toString() ))
+    return Command( path )
+
+  def execute(self):
+    e   = self.ent_
+    par = self.path_.clone()
+    par.up()
+    for (ent, val) in e.seq_:
+      if "usleep" == ent:
+        time.sleep( val/1.0E6 )
+      else:
+        ScalVal_WO.create( par.findByName( ent ) ).setVal( val )
+    if None != e.fn_:
+      e.fn_( self.path_ )
+    transaction_( "x" )
+
+class Stream(Entry_):
+  @staticmethod
+  def create(path):
+    if not isinstance( path.tail(), MockStream ):
+      raise InterfaceNotImplementedError("{}: Stream not supported".format( path.toString() ))
+    return Stream( path )
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    return False
+
+  # copy the next frame into 'buf' (any writable buffer); returns the
+  # number of bytes (0 on timeout)
+  def read(self, buf, timeoutUs = -1, offset = 0):
+    frm = self.ent_.pop_( timeoutUs )
+    transaction_( "s" )
+    if frm is None:
+      return 0
+    src = np.frombuffer( frm, 'uint8' ) if isinstance(frm, (bytes, bytearray)) else np.asarray( frm ).view('uint8').ravel()
+    dst = np.asarray( buf ).view('uint8').ravel()
+    src = src[offset:]
+    n   = min( len(src), len(dst) )
+    dst[0:n] = src[0:n]
+    return n
+
+# YAML
+
+_configLoader = None
+
+# PyYAML safe loader which also accepts CPSW's '!<value>' tag (as
+# written by bpmMiscUtils.logSval): the tagged node is read as if
+# it had no tag.
+def configLoader():
+  global _configLoader
+  if None == _configLoader:
+    import yaml
+    class ConfigLoader(yaml.SafeLoader):
+      pass
+    def value(loader, node):
+      val = node.value if isinstance( node, yaml.ScalarNode ) else None
+      return loader.construct_object( type(node)( loader.resolve( type(node), val, (True, False) ), node.value ), deep = True )
+    ConfigLoader.add_constructor( "value", value )
+    _configLoader = ConfigLoader
+  return _configLoader
+
+_includeRe = re.compile(r"^#include\s+(\S+)")
+
+# Expand '#include' directives; files containing '#once' are only
+# included once.
+def yamlPreprocess(fnam, incDirName = None, seen = None):
+  if None == seen:
+    seen = set()
+  if None == incDirName:
+    incDirName = os.path.dirname( fnam )
+  fnam = os.path.normpath( fnam )
+  with open( fnam ) as f:
+    lines = f.readlines()
+  if any( [ l.startswith("#once") for l in lines ] ):
+    if fnam in seen:
+      return ""
+    seen.add( fnam )
+  out = []
+  for l in lines:
+    m = _includeRe.match( l )
+    if None != m:
+      out.append( yamlPreprocess( os.path.join( incDirName, m.group(1) ), incDirName, seen ) )
+    else:
+      out.append( l )
+  return "".join( out )
+
+def classes_(node):
+  c = node.get("class", [])
+  if isinstance(c, str):
+    return [ c ]
+  return c
+
+def enums_(node):
+  en = node.get("enums")
+  if None == en:
+    return None
+  if isinstance(en, dict):
+    return [ (n, v) for (n, v) in en.items() ]
+  return [ ( i["name"], i["value"] ) for i in en ]
+
+def entryFromYaml(name, node):
+  if None == node:
+    node = dict()
+  if False == node.get("instantiate", True):
+    return None
+  at    = node.get("at") or dict()
+  nelms = int( at.get("nelms", 1) )
+  desc  = node.get("description", "")
+  cls   = classes_( node )
+  if "children" in node or any( [ c.endswith("Dev") for c in cls ] ):
+    h = MockHub( name, nelms, desc )
+    for (n, c) in ( node.get("children") or dict() ).items():
+      e = entryFromYaml( n, c )
+      if None != e:
+        h.add( e )
+    return h
+  if any( [ c.endswith("Command") for c in cls ] ):
+    seq = []
+    for i in node.get("sequence") or []:
+      for s in ( i if isinstance(i, list) else [ i ] ):
+        seq.append( ( s["entry"], s["value"] ) )
+    return MockCommand( name, nelms, seq, desc = desc )
+  if any( [ c in ("Field", "Stream") for c in cls ] ) and not "sizeBits" in node:
+    return MockStream( name, desc = desc )
+  mode = node.get("mode", "RW")
+  init = node.get("value", 0)
+  if "ConstIntField" in cls:
+    mode = "RO"
+  return MockField( name, nelms, sizeBits = int( node.get("sizeBits", 32) ), isSigned = bool( node.get("isSigned", False) ),
+                    mode = mode, enums = enums_( node ), init = init, desc = desc )
+
+def hubFromYamlFile(fnam, rootName = "root", incDirName = None, yamlFixup = None):
+  import yaml
+  doc = yaml.safe_load( yamlPreprocess( fnam, incDirName ) )
+  if not rootName in doc:
+    raise NotFoundError("{}: no root node '{}'".format( fnam, rootName ))
+  if None != yamlFixup:
+    yamlFixup( YamlNode_( doc, rootName ), YamlNode_( { "": doc }, "" ) )
+  return entryFromYaml( rootName, doc[rootName] )
+
+# configuration files applied by Path.loadYamlFile
+_initConfigs = []
+
+def addInitConfig(fnam):
+  _initConfigs.append( fnam )
+
+# Make 'import pycpsw' resolve to this module (a placeholder for
+# 'yaml_cpp', which comes with pycpsw, is provided if it is missing).
+def install():
+  mod = sys.modules[__name__]
+  sys.modules["pycpsw"] = mod
+  try:
+    import yaml_cpp
+  except ImportError:
+    sys.modules["yaml_cpp"] = types.ModuleType("yaml_cpp")
+  return mod
+
+# Spawned processes (e.g., the LinSim synthesis workers) re-import the
+# script but not this module; a 'pycpsw' module on the (inherited)
+# search path which installs the mock lets them import it, too.
+def installForSubprocesses():
+  import tempfile
+  import shutil
+  d = tempfile.mkdtemp( prefix = "mockCpsw" )
+  with open( os.path.join( d, "pycpsw.py" ), "w" ) as f:
+    f.write( "import mockCpsw\nmockCpsw.install()\n" )
+  sys.path.insert( 0, d )
+  sys.path.insert( 1, os.path.dirname( os.path.abspath( __file__ ) ) )
+  atexit.register( shutil.rmtree, d, True )
+
+def printStats():
+  s = getStats()
+  print("mockCpsw: " + ", ".join( [ "{}: {}".format( k, v ) for (k, v) in s.items() ] ))
+
+def usage(nm):
+  print("Usage: {} [-l latency_us] [-c config.yaml] [-e] [-s] [-h] script.py [script args]".format( nm ))
+
+if __name__ == "__main__":
+  opts, args = getopt.getopt( sys.argv[1:], "l:c:esh" )
+  for opt,arg in opts:
+    if   opt == "-l":
+      setLatency( float(arg)/1.0E6 )
+    elif opt == "-c":
+      addInitConfig( arg )
+    elif opt == "-e":
+      exploreElements = True
+    elif opt == "-s":
+      atexit.register( printStats )
+    elif opt == "-h":
+      usage( sys.argv[0] )
+      sys.exit(0)
+  if len(args) < 1:
+    usage( sys.argv[0] )
+    sys.exit(1)
+  install()
+  installForSubprocesses()
+  sys.argv = args
+  sys.path.insert( 0, os.path.dirname( os.path.abspath( args[0] ) ) )
+  runpy.run_path( args[0], run_name = "__main__" )
@@ -2,6 +2,102 @@
 
 import pycpsw
 import re
+import os
+import json
+import bisect
+import threading
+
+# Flattened index of all paths under a root: one traversal of the
+# hierarchy records every path string along with its depth, tail-name
+# and array range. The index may be saved to and loaded from a cache
+# file (see PathGrep).
+class PathIndex(pycpsw.PathVisitor):
+  version = 1
+
+  def __init__(self):
+    pycpsw.PathVisitor.__init__(self)
+    self.clear_()
+
+  def clear_(self):
+    self.level  = 0
+    self.paths  = []
+    self.levels = []
+    self.names  = []
+    self.froms  = []
+    self.tos    = []
+    self.sorted_= None
+    self.leaves_= None
+
+  def build(self, root):
+    self.clear_()
+    root.explore(self)
+    return self
+
+  def visitPre(self, path):
+    self.level = self.level + 1
+    self.paths.append ( path.toString()     )
+    self.levels.append( self.level          )
+    self.names.append ( path.tail().getName() )
+    self.froms.append ( path.getTailFrom()  )
+    self.tos.append   ( path.getTailTo()    )
+    return True
+
+  def visitPost(self, path):
+    self.level = self.level - 1
+
+  def __len__(self):
+    return len(self.paths)
+
+  # indices of paths matching compiled RE 'prog' (up to 'maxl' levels deep)
+  def search(self, prog, maxl = -1):
+    s = prog.search
+    if maxl < 0:
+      return [ i for (i, p) in enumerate( self.paths ) if s( p ) != None ]
+    return [ i for (i, p) in enumerate( self.paths ) if self.levels[i] <= maxl and s( p ) != None ]
+
+  # indices of paths starting with 'pfx'
+  def prefix(self, pfx):
+    if None == self.sorted_:
+      self.sorted_ = sorted( range( len( self.paths ) ), key = lambda i: self.paths[i] )
+      self.skeys_  = [ self.paths[i] for i in self.sorted_ ]
+    lo = bisect.bisect_left( self.skeys_, pfx )
+    hi = lo
+    while hi < len( self.skeys_ ) and self.skeys_[hi].startswith( pfx ):
+      hi = hi + 1
+    return sorted( self.sorted_[lo:hi] )
+
+  # indices of paths ending in 'sfx' (ignoring a trailing array range)
+  def leaf(self, sfx):
+    if None == self.leaves_:
+      self.leaves_ = [ re.sub( r"\[[^]]+\]$", "", p ) for p in self.paths ]
+    return [ i for (i, p) in enumerate( self.leaves_ ) if p.endswith( sfx ) ]
+
+  def save(self, fnam):
+    d = os.path.dirname( fnam )
+    if len(d) > 0:
+      os.makedirs( d, exist_ok = True )
+    tmp = fnam + ".tmp{}".format( os.getpid() )
+    with open(tmp, "w") as f:
+      json.dump( { "version" : self.version,
+                   "paths"   : self.paths,
+                   "levels"  : self.levels,
+                   "names"   : self.names,
+                   "froms"   : self.froms,
+                   "tos"     : self.tos }, f )
+    os.replace( tmp, fnam )
+
+  def load(self, fnam):
+    with open(fnam, "r") as f:
+      d = json.load( f )
+    if d["version"] != self.version:
+      raise RuntimeError("PathIndex: cache version mismatch")
+    self.clear_()
+    self.paths  = d["paths"]
+    self.levels = d["levels"]
+    self.names  = d["names"]
+    self.froms  = d["froms"]
+    self.tos    = d["tos"]
+    return self
 
 # Subclass the PathVisitor.
 #
@@ -13,12 +109,19 @@ import re
 #
 # any argument can be omitted in which case
 # the previous values are used.
+#
+# The hierarchy is traversed only once; all queries are run against
+# a flattened index (PathIndex). If a 'cacheKey' is given (e.g., the
+# content hash of the YAML file, see LoadYaml.cacheKey()) then the
+# index is stored in 'cacheDir' and reused by subsequent instances.
 class PathGrep(pycpsw.PathVisitor):
   """Recurse through CPSW hierarchy looking for RE pattern matches
 
      Starts recursion at 'path' and returns a list of RE matches.
   """
-  def __init__(self, root = None, patt = None, asPath = False):
+  cacheDir = os.path.join( os.path.expanduser("~"), ".cache", "bpmPathIndex" )
+
+  def __init__(self, root = None, patt = None, asPath = False, cacheKey = None):
     pycpsw.PathVisitor.__init__(self)
     self.level   = 0
     self.result  = []
@@ -26,6 +129,9 @@ class PathGrep(pycpsw.PathVisitor):
     self.setPatt_( patt )
     self.maxl    = -1
     self.asPath_ = asPath
+    self.key_    = cacheKey
+    self.idx_    = None
+    self.lock_   = threading.RLock()
 
   def setPatt_(self, patt):
     if patt == None:
@@ -62,20 +168,80 @@ class PathGrep(pycpsw.PathVisitor):
     return self.root
 
   def setRoot(self, root):
-    self.root = root
+    with self.lock_:
+      self.root = root
+      self.idx_ = None
+
+  def getCacheFile(self):
+    if None == self.key_:
+      return None
+    return os.path.join( self.cacheDir, "{}.json".format( self.key_ ) )
+
+  def getIndex(self):
+    with self.lock_:
+      return self.getIndex_()
+
+  def getIndex_(self):
+    if self.idx_ != None:
+      return self.idx_
+    if self.root    == None:
+      raise Exception("No root set");
+    fnam = self.getCacheFile()
+    if fnam != None:
+      try:
+        self.idx_ = PathIndex().load( fnam )
+        return self.idx_
+      except (OSError, ValueError, KeyError, RuntimeError):
+        pass
+    self.idx_ = PathIndex().build( self.root )
+    if fnam != None:
+      try:
+        self.idx_.save( fnam )
+      except OSError as e:
+        print("PathGrep: unable to save index cache ({})".format(e))
+    return self.idx_
+
+  def result_(self, idxs):
+    paths = self.getIndex().paths
+    if self.asPath_:
+      return [ self.root.findByName( paths[i] ) for i in idxs ]
+    return [ paths[i] for i in idxs ]
+
+  # paths starting with 'pfx'
+  def prefix(self, pfx):
+    return self.result_( self.getIndex().prefix( pfx ) )
 
+  # paths ending in 'sfx' (ignoring a trailing array range)
+  def leaf(self, sfx):
+    return self.result_( self.getIndex().leaf( sfx ) )
+
+  # Thread-safe: the query runs on local state only (the pattern is
+  # remembered for subsequent calls but 'self.result' is just a copy
+  # of the last result for convenience).
   def __call__(self, patt = False, maxlevel = -1):
     if maxlevel >=0:
-      self.maxl = maxlevel + 1
+      maxl = maxlevel + 1
     else:
-      self.maxl = -1
-    if patt or patt == None:
-      self.setPatt_( patt )
-    if self.root    == None:
-      raise Exception("No root set");
-    if self.re_prog != None:
-      self.result = []
+      maxl = -1
+    with self.lock_:
+      if patt or patt == None:
+        self.setPatt_( patt )
+      prog = self.re_prog
+      idx  = self.getIndex()
+    if prog != None:
+      res = self.result_( idx.search( prog, maxl ) )
     else:
-      self.result = None
-    self.root.explore(self)
-    return self.result
+      res = None
+      for i in range( len( idx ) ):
+        if maxl >= 0 and idx.levels[i] > maxl:
+          continue
+        fr = idx.froms[i]
+        to = idx.tos[i]
+        st = '{:<{}s}{}[{}'.format('',idx.levels[i],idx.names[i],fr)
+        if fr == to:
+          st+="]"
+        else:
+          st+="-{}]".format(to)
+        print(st)
+    self.result = res
+    return res